@@ -1,20 +1,21 @@
 from flask import Flask
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
-from apscheduler.schedulers.background import BackgroundScheduler
 
 from app.config import Config
-from app.services.database import get_db
 from app.services.logging_service import setup_logging
-from app.services.schedule_service import setup_schedulers
+from app.services.warmup_service import mark_app_created
+from app.utils.http_cache import compress_response
+from app.utils.json_provider import FastJSONProvider
 
-import pytz
 import os
-import threading
+import time
 
 def create_app():
+    started = time.perf_counter()
     app = Flask(__name__)
     app.config.from_object(Config)
+    app.json = FastJSONProvider(app)
     CORS(app, resources={r"/api/*": {"origins": "http://localhost:3000"}}) # for development
     JWTManager(app)
     setup_logging()
@@ -24,15 +25,25 @@ def create_app():
     from app.routes.users import users_bp
     from app.routes.venues import venues_bp
     from app.routes.items import items_bp
+    from app.routes.webhooks import webhooks_bp
+    from app.routes.health import health_bp
 
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(users_bp, url_prefix='/api/users')
     app.register_blueprint(venues_bp, url_prefix='/api/venues')
     app.register_blueprint(items_bp, url_prefix='/api/items')
+    app.register_blueprint(webhooks_bp, url_prefix='/api/webhooks')
+    app.register_blueprint(health_bp)
+    app.after_request(compress_response)
 
-    # scheduler
-    if not os.environ.get("WERKZEUG_RUN_MAIN"):
-        scheduler = BackgroundScheduler(timezone=pytz.timezone('Asia/Jerusalem'))
-        threading.Thread(target=setup_schedulers, args=(scheduler,), daemon=True).start()
+    # scheduler, disabled in the web workers of a production deployment (see gunicorn.conf.py)
+    if Config.RUN_SCHEDULER and not os.environ.get("WERKZEUG_RUN_MAIN"):
+        from app.services.schedule_service import start_background_scheduler
+        start_background_scheduler()
+
+    # nothing above touches mongo or the upstream. The caches are warmed by each serving process
+    # (gunicorn post_fork, main.py), never here: with preload_app this runs in the master before the fork
+    mark_app_created(time.perf_counter() - started)
+    print(f"App created in {round((time.perf_counter() - started) * 1000)}ms")
 
     return app
\ No newline at end of file
@@ -6,4 +6,85 @@ class Config:
     JWT_ACCESS_TOKEN_EXPIRES = 604800  # 7 days in seconds
     MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/database")
     CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:3000")
-    LOG_FILE = os.getenv("LOG_FILE", "app.log")
\ No newline at end of file
+    LOG_FILE = os.getenv("LOG_FILE", "app.log")
+    PICKING_AREAS_TTL = int(os.getenv("PICKING_AREAS_TTL", 3 * 24 * 60 * 60))  # 3 days in seconds
+
+    # upstream api protection, shared by every call to the same host
+    UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", 30))
+    UPSTREAM_RATE_LIMIT = float(os.getenv("UPSTREAM_RATE_LIMIT", 10))  # requests per second per host
+    UPSTREAM_BURST = int(os.getenv("UPSTREAM_BURST", 20))
+    UPSTREAM_MIN_CONCURRENCY = int(os.getenv("UPSTREAM_MIN_CONCURRENCY", 1))
+    UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", 16))
+    UPSTREAM_INITIAL_CONCURRENCY = int(os.getenv("UPSTREAM_INITIAL_CONCURRENCY", 4))
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+    CIRCUIT_RESET_TIMEOUT = int(os.getenv("CIRCUIT_RESET_TIMEOUT", 60))  # seconds
+
+    REPROCESS_WORKERS = int(os.getenv("REPROCESS_WORKERS", 2))
+    REPROCESS_JOB_STALE_AFTER = int(os.getenv("REPROCESS_JOB_STALE_AFTER", 30 * 60))  # seconds without progress
+
+    # only one process per deployment should run the venue jobs, see gunicorn.conf.py and scheduler.py
+    RUN_SCHEDULER = os.getenv("RUN_SCHEDULER", "true").lower() == "true"
+    HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 20))
+
+    # venue rules and picking areas are loaded in the background after startup, /readyz reports it
+    WARMUP = os.getenv("WARMUP", "true").lower() == "true"
+    WARMUP_RETRY_INTERVAL = float(os.getenv("WARMUP_RETRY_INTERVAL", 2))  # seconds, doubles up to a minute
+
+    PRESENCE_FLUSH_INTERVAL = float(os.getenv("PRESENCE_FLUSH_INTERVAL", 10))  # seconds
+    USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 30))  # seconds
+
+    # buffered writer for the history collection
+    AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", 100))
+    AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", 2))  # seconds
+    AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", 10000))
+    AUDIT_ENQUEUE_TIMEOUT = float(os.getenv("AUDIT_ENQUEUE_TIMEOUT", 0.5))  # seconds a request waits on a full queue
+    AUDIT_WRITE_RETRIES = int(os.getenv("AUDIT_WRITE_RETRIES", 3))
+
+    # in-process cache of read endpoints, invalidated through per-venue generation counters in mongo
+    RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 1000))  # entries
+    RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 5 * 60))  # seconds
+    CACHE_GENERATION_TTL = float(os.getenv("CACHE_GENERATION_TTL", 1))  # seconds a process trusts its last generation read
+
+    COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))  # bytes
+    COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", 6))
+
+    # the attach POSTs are only sent when enabled, otherwise runs are logged as a dry run
+    ATTACH_ITEMS = os.getenv("ATTACH_ITEMS", "false").lower() == "true"
+    ATTACH_BATCH_SIZE = int(os.getenv("ATTACH_BATCH_SIZE", 100))
+    # retention of item_updates and history, 0 keeps everything. "archive" moves expired documents to
+    # gzip json lines under ARCHIVE_DIR once a day, "ttl" lets a mongo ttl index delete them
+    ITEM_UPDATES_RETENTION_DAYS = int(os.getenv("ITEM_UPDATES_RETENTION_DAYS", 0))
+    HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", 0))
+    RETENTION_MODE = os.getenv("RETENTION_MODE", "archive")
+    RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 1000))
+    ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+
+    PIPELINE_RESUME_WINDOW = int(os.getenv("PIPELINE_RESUME_WINDOW", 6 * 60 * 60))  # seconds an interrupted run stays resumable
+    PIPELINE_RUNS_RETENTION_DAYS = int(os.getenv("PIPELINE_RUNS_RETENTION_DAYS", 30))  # finished runs, 0 keeps them
+    SNAPSHOT_COMPRESSION_LEVEL = int(os.getenv("SNAPSHOT_COMPRESSION_LEVEL", 6))
+
+    # "local" runs venue jobs inside the scheduler process, "queue" enqueues them for worker.py
+    SCHEDULER_EXECUTION = os.getenv("SCHEDULER_EXECUTION", "local")
+    # "sync" runs every venue in its own thread, "async" runs all due venues in one event loop
+    # (needs httpx and motor) with a global budget of upstream requests in flight
+    EXECUTION_ENGINE = os.getenv("EXECUTION_ENGINE", "sync")
+    ASYNC_HTTP_CONCURRENCY = int(os.getenv("ASYNC_HTTP_CONCURRENCY", 50))
+    ASYNC_VENUE_CONCURRENCY = int(os.getenv("ASYNC_VENUE_CONCURRENCY", 20))
+    ASYNC_VENUE_TIMEOUT = float(os.getenv("ASYNC_VENUE_TIMEOUT", 20 * 60))  # seconds one venue may take in the event loop
+    VENUE_LEASE_TTL = int(os.getenv("VENUE_LEASE_TTL", 120))  # seconds
+    WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", 5))  # seconds
+    WORKER_MAX_ATTEMPTS = int(os.getenv("WORKER_MAX_ATTEMPTS", 3))
+
+    # "adaptive" schedules poll the unassigned items for changes instead of running on the hour
+    ADAPTIVE_MIN_INTERVAL = int(os.getenv("ADAPTIVE_MIN_INTERVAL", 5 * 60))  # seconds
+    ADAPTIVE_MAX_INTERVAL = int(os.getenv("ADAPTIVE_MAX_INTERVAL", 60 * 60))  # seconds
+    ADAPTIVE_BACKOFF = float(os.getenv("ADAPTIVE_BACKOFF", 2))
+    ADAPTIVE_FULL_RUN_AFTER = int(os.getenv("ADAPTIVE_FULL_RUN_AFTER", 24 * 60 * 60))  # seconds, catches item config changes
+
+    # item webhooks are signed with an HMAC-SHA256 of "<timestamp>.<delivery id>.<venue id>." plus the body,
+    # the endpoint is disabled without a secret
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+    WEBHOOK_BATCH_WINDOW = float(os.getenv("WEBHOOK_BATCH_WINDOW", 2))  # seconds
+    WEBHOOK_TOLERANCE = int(os.getenv("WEBHOOK_TOLERANCE", 5 * 60))  # seconds a signed timestamp stays valid
+    WEBHOOK_RETRY_INTERVAL = float(os.getenv("WEBHOOK_RETRY_INTERVAL", 30))  # seconds, while the venue is running elsewhere
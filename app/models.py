@@ -1,5 +1,125 @@
-from bson import ObjectId
+import sys
 
-def serialize_document(doc):
-    doc['_id'] = str(doc['_id'])
-    return doc
+
+def _intern(value):
+    # ids keep their upstream type, only strings can be interned
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def normalize_location(location):
+    if "-" in location:
+        return "-".join(location.split("-")[:2])
+    return location
+
+
+class PickingAreaIndex:
+    # picking areas of a venue, looked up by their upper-cased name
+    __slots__ = ("ids", "names", "by_name", "by_id")
+
+    def __init__(self, areas):
+        self.ids = []
+        self.names = []
+        self.by_name = {}
+        self.by_id = {}
+        for area in areas:
+            position = len(self.ids)
+            area_id = _intern(area["id"])
+            self.ids.append(area_id)
+            self.names.append(sys.intern(area["name"]))
+            self.by_name[sys.intern(area["name"].upper())] = position
+            self.by_id[area_id] = position
+
+    def find(self, name):
+        position = self.by_name.get(name)
+        return None if position is None else self.ids[position]
+
+    def name_of(self, area_id, default="Unknown"):
+        position = self.by_id.get(area_id)
+        return default if position is None else self.names[position]
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class ItemConfigIndex:
+    # item id -> storage location, the ids keep their upstream type and equal locations share one string
+    __slots__ = ("locations",)
+
+    def __init__(self):
+        self.locations = {}
+
+    def add(self, item_id, storage_location):
+        self.locations[item_id] = sys.intern(storage_location or "")
+
+    def location(self, item_id):
+        return self.locations.get(item_id)
+
+    def __contains__(self, item_id):
+        return item_id in self.locations
+
+    def __len__(self):
+        return len(self.locations)
+
+
+class CompiledRules:
+    # bin mappings, location transformations and overflow locations of a venue, ready for matching
+    __slots__ = ("renamed_locations", "transformations", "overflow_locations", "version")
+
+    def __init__(self, renamed_locations, transformations, overflow_locations, version=None):
+        self.renamed_locations = renamed_locations
+        self.transformations = transformations
+        self.overflow_locations = overflow_locations
+        self.version = version
+
+    @classmethod
+    def from_settings(cls, venue_settings):
+        # the rules are matched exactly as they were saved
+        renamed_locations = {
+            sys.intern(mapping['binLocation']): sys.intern(mapping['pickingArea'])
+            for mapping in venue_settings.get('binMappings', [])
+            if mapping.get('binLocation') and mapping.get('pickingArea')
+        }
+        transformations = tuple(
+            (transformation['original'], sys.intern(transformation['transformed']))
+            for transformation in venue_settings.get('locationTransformations', [])
+            if transformation.get('original') and transformation.get('transformed')
+        )
+        # overflow locations were stored both as plain strings and as {"id", "location"} rows
+        overflow_locations = frozenset(
+            overflow if isinstance(overflow, str) else overflow.get('location', '')
+            for overflow in venue_settings.get('overflowLocations', [])
+            if isinstance(overflow, (str, dict))
+        )
+        return cls(renamed_locations, transformations, overflow_locations, venue_settings.get('rulesVersion'))
+
+    def resolve(self, storage_location):
+        # candidate picking area names for a storage location, in order of preference
+        for loc in storage_location.replace(",", "/").split("/"):
+            loc = loc.split("(")[0].strip().upper()
+
+            # if the location is in overflow locations set, skip this location and move to the next
+            if loc in self.overflow_locations:
+                continue
+
+            for original, transformed in self.transformations:
+                if loc.startswith(original):
+                    loc = transformed
+                    break
+
+            loc = self.renamed_locations.get(loc, loc)
+            yield normalize_location(loc)
+
+
+def load_picking_areas(areas):
+    return PickingAreaIndex(areas)
+
+
+def load_item_configs(item_configs):
+    index = ItemConfigIndex()
+    for item in item_configs:
+        index.add(item["itemId"], item.get("storageLocation", ""))
+    return index
+
+
+def load_unassigned_ids(unassigned_items):
+    return [item["id"] for item in unassigned_items['data']]
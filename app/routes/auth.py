@@ -1,8 +1,10 @@
-from datetime import datetime
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt
 from werkzeug.security import check_password_hash
+from app.services.cache_service import ALL_VENUES, bump_generation
 from app.services.database import get_db
+from app.services.presence_service import record_presence
+from app.services.user_service import get_current_user, invalidate_user
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -41,7 +43,7 @@ def get_user():
     client_ip = request.headers.get('X-Forwarded-For', request.remote_addr)
     db = get_db()
 
-    user_document = db.users.find_one({'username': current_user})
+    user_document = get_current_user()
     if not user_document:
         return jsonify({"error": "User not found"}), 404
 
@@ -67,15 +69,8 @@ def get_user():
         if not venue_settings:
             return jsonify({"error": "Venue not found"}), 404
 
-    if not user_document.get('firstLogin', False):
-        user_document['firstLogin'] = True
-        db.users.update_one({'username': current_user}, {'$set': {'firstLogin': True}})
-
-    db.users.update_one(
-        {'username': current_user},
-        {'$set': {'last_seen': datetime.utcnow(), 'ip_address': client_ip}},
-        upsert=True
-    )
+    # presence is written behind in batches, this endpoint is polled by the frontend
+    record_presence(current_user, client_ip, first_login=not user_document.get('firstLogin', False))
 
     return jsonify({
         "logged_in_as": current_user,
@@ -91,7 +86,7 @@ def set_venue_for_user(venue_id):
         return jsonify({"error": "Unauthorized"}), 403
 
     db = get_db()
-    user_document = db.users.find_one({'username': get_jwt_identity()})
+    user_document = get_current_user()
     if not user_document:
         return jsonify({"error": "User not found"}), 404
 
@@ -100,4 +95,7 @@ def set_venue_for_user(venue_id):
         return jsonify({"error": "Venue not found"}), 404
 
     db.users.update_one({'username': get_jwt_identity()}, {'$set': {'venue_id': venue_id}})
+    invalidate_user(get_jwt_identity())
+    # moves the user between the counts of the venue list
+    bump_generation(ALL_VENUES)
     return jsonify({"message": "Venue set successfully"}), 200
\ No newline at end of file
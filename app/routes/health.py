@@ -0,0 +1,17 @@
+from flask import Blueprint, jsonify
+from app.services.warmup_service import get_warmup_state
+
+health_bp = Blueprint('health', __name__)
+
+
+@health_bp.route('/healthz', methods=['GET'])
+def healthz():
+    # liveness only, never touches mongo or the upstream
+    state = get_warmup_state()
+    return jsonify({"status": "ok", "uptime": state["uptime"], "appCreatedIn": state["appCreatedIn"]}), 200
+
+
+@health_bp.route('/readyz', methods=['GET'])
+def readyz():
+    state = get_warmup_state()
+    return jsonify(state), 200 if state["status"] == "ready" else 503
@@ -3,7 +3,11 @@ import os
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt
 from app.services.database import get_db
-from app.services.item_service import reprocess_items
+from app.utils.http_cache import cached_response, etag_response
+from app.services.snapshot_service import get_snapshot_info
+from app.services.retention_service import read_archive
+from app.services.user_service import get_current_user
+from app.services.job_service import get_job, serialize_job, submit_reprocess_job
 from datetime import datetime, timedelta
 import pytz
 
@@ -11,6 +15,8 @@ items_bp = Blueprint('items', __name__)
 
 @items_bp.route('/overview', methods=['GET'])
 @jwt_required()
+@etag_response
+@cached_response(lambda: get_jwt().get('venue_id'))
 def get_overview():
     claims = get_jwt()
     venue_id = claims.get('venue_id')
@@ -19,8 +25,8 @@ def get_overview():
         return jsonify({"error": "Invalid venue ID"}), 400
 
     db = get_db()
-    unassigned_items = db.unassigned_items.find_one({"venue_id": venue_id})
-    item_configs = db.item_configs.find_one({"venue_id": venue_id})
+    unassigned_items = get_snapshot_info("unassigned_items", venue_id)
+    item_configs = get_snapshot_info("item_configs", venue_id)
 
     if not unassigned_items or not item_configs:
         return jsonify({"error": "No data available"}), 404
@@ -32,17 +38,18 @@ def get_overview():
     return jsonify({
         "venue": venue_id,
         "overviewMessage": message,
-        "totalItems": len(item_configs.get("item_configs", [])),
-        "unassignedItems": len(unassigned_items.get("unassigned_items", []))
+        "totalItems": item_configs.get("item_count", 0),
+        "unassignedItems": unassigned_items.get("item_count", 0)
     }), 200
 
 @items_bp.route('/history', methods=['GET'])
 @jwt_required()
+@etag_response
+@cached_response(lambda: (get_current_user() or {}).get('venue_id'))
 def get_history():
     try:
         db = get_db()
-        claims = get_jwt()
-        user = db.users.find_one({"username": claims['sub']})
+        user = get_current_user()
 
         if not user:
             return jsonify({"error": "User not found"}), 404
@@ -74,6 +81,37 @@ def get_history():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@items_bp.route('/history/archive', methods=['GET'])
+@jwt_required()
+def get_archived_history():
+    # assignments older than the item_updates retention, read from the archive files on demand
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    try:
+        start = datetime.strptime(request.args['from'], '%Y-%m-%d') if request.args.get('from') else None
+        end = datetime.strptime(request.args['to'], '%Y-%m-%d') + timedelta(days=1) if request.args.get('to') else None
+    except ValueError:
+        return jsonify({"error": "Dates must be formatted as YYYY-MM-DD"}), 400
+
+    limit = min(request.args.get('limit', 1000, type=int), 10000)
+    tz = pytz.timezone('Asia/Jerusalem')
+    items = []
+    for item in read_archive("item_updates", venue=user['venue_id'], start=start, end=end, limit=limit):
+        updated_at = item['timestamp'].replace(tzinfo=pytz.utc).astimezone(tz)
+        items.append({
+            "id": item["item_id"],
+            "image": item.get("image_url", "default-image.jpg"),
+            "name": item["product_name"],
+            "gtin": item.get("gtin", "N/A"),
+            "previousPickingArea": item.get("previous_picking_area", "Unassigned Items"),
+            "pickingArea": item["picking_area_name"],
+            "updatedAt": updated_at.isoformat()
+        })
+
+    return jsonify(items), 200
+
 @items_bp.route('/logs', methods=['GET'])
 @jwt_required()
 def get_logs():
@@ -83,8 +121,7 @@ def get_logs():
         return jsonify({"error": "Unauthorized"}), 403
 
     # validate with the db that the user is administrator
-    db = get_db()
-    user = db.users.find_one({"username": claims['sub']})
+    user = get_current_user()
     if not user:
         return jsonify({"error": "User not found"}), 404
 
@@ -123,6 +160,8 @@ def parse_log_line(line):
 
 @items_bp.route('/overview/last-assigned', methods=['GET'])
 @jwt_required()
+@etag_response
+@cached_response(lambda: get_jwt().get('venue_id'))
 def last_assigned_items():
     claims = get_jwt()
     venue_id = claims.get('venue_id')
@@ -168,5 +207,17 @@ def reprocess_items_route():
     if not venue_id:
         return jsonify({"error": "Venue ID not found in token"}), 400
 
-    result = reprocess_items(venue_id)
-    return jsonify(result), 200
+    job, created = submit_reprocess_job(venue_id, requested_by=claims.get('sub'))
+    message = "Reprocess job queued" if created else "Reprocess job already running for this venue"
+    return jsonify({"message": message, **serialize_job(job)}), 202
+
+@items_bp.route('/reprocess-items/<job_id>', methods=['GET'])
+@jwt_required()
+def reprocess_job_status(job_id):
+    claims = get_jwt()
+    job = get_job(job_id)
+
+    if not job or (claims.get('role') != 'administrator' and job['venue_id'] != claims.get('venue_id')):
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify(serialize_job(job)), 200
@@ -1,8 +1,11 @@
 from flask import Blueprint, request, jsonify
 from werkzeug.security import generate_password_hash
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from app.services.cache_service import ALL_VENUES, bump_generation
 from app.services.database import get_db
-from app.utils.helpers import logdb_users_history
+from app.utils.http_cache import etag_response
+from app.services.user_service import get_current_user, invalidate_user
+from app.services.audit_service import log_history
 from bson import ObjectId
 
 users_bp = Blueprint('users', __name__)
@@ -10,10 +13,10 @@ users_bp = Blueprint('users', __name__)
 
 @users_bp.route('/', methods=['GET'])
 @jwt_required()
+@etag_response
 def get_users():
-    current_user = get_jwt_identity()
     db = get_db()
-    user_document = db.users.find_one({'username': current_user})
+    user_document = get_current_user()
 
     if not user_document:
         return jsonify({"error": "User not found"}), 404
@@ -27,7 +30,6 @@ def get_users():
         return jsonify({"error": "Unauthorized"}), 403
 
     for user in users:
-        user['_id'] = str(user['_id'])
         user["venue_name"] = "All venues" if user["role"] == "administrator" else \
         db.venue_settings.find_one({"venue_id": user["venue_id"]})['venue_name']
         user['can_edit'] = user_document['role'] == 'administrator' or (
@@ -45,30 +47,33 @@ def delete_user(user_id):
     db = get_db()
 
     current_user = get_jwt_identity()
-    user_document = db.users.find_one({'username': current_user})
+    user_document = get_current_user()
     if not user_document:
         return jsonify({"error": "User not found"}), 404
 
     # validate if the user exists
     user = db.users.find_one({'_id': ObjectId(user_id)})
     if not user:
-        logdb_users_history(db, ObjectId(user_document['_id']), 'delete_user', None, f'User {user_id} not found', 'failed')
+        log_history('users', 'delete_user', f'User {user_id} not found', 'failed', user=ObjectId(user_document['_id']))
         return jsonify({"error": "User not found"}), 404
 
     if user_document['role'] not in ['administrator', 'venue_manager']:
-        logdb_users_history(db, ObjectId(user_document['_id']), 'delete_user', ObjectId(user['_id']), "Unauthorized", 'failed')
+        log_history('users', 'delete_user', "Unauthorized", 'failed', user=ObjectId(user_document['_id']), target=ObjectId(user['_id']))
         return jsonify({"error": "Unauthorized"}), 403
 
     if user['username'] == current_user:
-        logdb_users_history(db, ObjectId(user_document['_id']), 'delete_user', ObjectId(user['_id']), "Cannot delete yourself", 'failed')
+        log_history('users', 'delete_user', "Cannot delete yourself", 'failed', user=ObjectId(user_document['_id']), target=ObjectId(user['_id']))
         return jsonify({"error": "Cannot delete yourself"}), 403
 
     if user.get('is_dev') == True:
-        logdb_users_history(db, ObjectId(user_document['_id']), 'delete_user', ObjectId(user['_id']), "Cannot delete a developer", 'failed')
+        log_history('users', 'delete_user', "Cannot delete a developer", 'failed', user=ObjectId(user_document['_id']), target=ObjectId(user['_id']))
         return jsonify({"error": "Insufficient permissions"}), 403
 
     db.users.delete_one({'_id': ObjectId(user_id)})
-    logdb_users_history(db, ObjectId(user_document['_id']), 'delete_user', ObjectId(user['_id']), f"User {user['_id']} deleted successfully")
+    invalidate_user(user['username'])
+    # the venue list shows how many users each venue has
+    bump_generation(ALL_VENUES)
+    log_history('users', 'delete_user', f"User {user['_id']} deleted successfully", user=ObjectId(user_document['_id']), target=ObjectId(user['_id']))
     return jsonify({"message": "User deleted successfully"}), 200
 
 @users_bp.route('/<user_id>', methods=['PUT'])
@@ -82,19 +87,19 @@ def update_user(user_id):
     except:
         return jsonify({"error": "Invalid user ID"}), 400
 
-    user_document = db.users.find_one({'username': current_user})
-
-    sender_id = ObjectId(user_document['_id'])
+    user_document = get_current_user()
 
     if not user_document:
         return jsonify({"error": "User not found"}), 404
 
+    sender_id = ObjectId(user_document['_id'])
+
     is_admin = user_document['role'] == 'administrator'
     is_venue_manager = user_document['role'] == 'venue_manager'
     is_dev = user_document.get('is_dev')
 
     if not is_admin and not is_venue_manager:
-        logdb_users_history(db, sender_id, "update_user", None, "Unauthorized (privilege escalation)", "failed")
+        log_history("users", "update_user", "Unauthorized (privilege escalation)", "failed", user=sender_id)
         return jsonify({"error": "Unauthorized"}), 403
 
     user = db.users.find_one({'_id': user_id})
@@ -102,11 +107,11 @@ def update_user(user_id):
         return jsonify({"error": "User not found"}), 404
 
     if user['username'] == current_user:
-        logdb_users_history(db, sender_id, "update_user", user_id, "Cannot modify yourself", "failed")
+        log_history("users", "update_user", "Cannot modify yourself", "failed", user=sender_id, target=user_id)
         return jsonify({"error": "Unauthorized: Cannot modify yourself"}), 403
 
     if user['role'] == 'administrator' and not is_dev:
-        logdb_users_history(db, sender_id, "update_user", user_id, "Cannot modify an administrator", "failed")
+        log_history("users", "update_user", "Cannot modify an administrator", "failed", user=sender_id, target=user_id)
         return jsonify({"error": "Unauthorized: Cannot modify an administrator"}), 403
 
     update_data = request.json
@@ -114,24 +119,24 @@ def update_user(user_id):
     filtered_data = {key: update_data[key] for key in update_data if key in allowed_fields}
 
     if not filtered_data:
-        logdb_users_history(db, sender_id, "update_user", user_id, "No valid fields provided", "failed")
+        log_history("users", "update_user", "No valid fields provided", "failed", user=sender_id, target=user_id)
         return jsonify({"error": "No valid fields provided"}), 400
 
     if is_venue_manager and 'role' in filtered_data and filtered_data['role'] == 'administrator':
         return jsonify({"error": "Unauthorized"}), 403
 
     db.users.update_one({'_id': user_id}, {'$set': filtered_data})
-    logdb_users_history(db, sender_id, "update_user", user_id, f"Updated user: {filtered_data}")
+    invalidate_user(user['username'], filtered_data.get('username'))
+    log_history("users", "update_user", f"Updated user: {filtered_data}", user=sender_id, target=user_id)
 
     return jsonify({"message": "User updated successfully"}), 200
 
 @users_bp.route('/add', methods=['POST'])
 @jwt_required()
 def add_user():
-    current_user = get_jwt_identity()
     db = get_db()
 
-    user_document = db.users.find_one({'username': current_user})
+    user_document = get_current_user()
 
     if not user_document:
         return jsonify({"error": "User not found"}), 404
@@ -140,21 +145,21 @@ def add_user():
     is_venue_manager = user_document['role'] == 'venue_manager'
 
     if not is_admin and not is_venue_manager:
-        logdb_users_history(db, ObjectId(user_document['_id']), "add_user", None, "Unauthorized (privilege escalation)", "failed")
+        log_history("users", "add_user", "Unauthorized (privilege escalation)", "failed", user=ObjectId(user_document['_id']))
 
         return jsonify({"error": "Unauthorized"}), 403
     new_user = request.json
 
     if not new_user.get('username') or not new_user.get('password') or not new_user.get('role'):
-        logdb_users_history(db, ObjectId(user_document['_id']), "add_user", None, "Missing required fields", "failed")
+        log_history("users", "add_user", "Missing required fields", "failed", user=ObjectId(user_document['_id']))
         return jsonify({"error": "Missing required fields"}), 400
 
     if is_venue_manager and new_user['role'] == 'administrator':
-        logdb_users_history(db, ObjectId(user_document['_id']), "add_user", None, "Venue managers cannot assign administrator roles", "failed")
+        log_history("users", "add_user", "Venue managers cannot assign administrator roles", "failed", user=ObjectId(user_document['_id']))
         return jsonify({"error": "Unauthorized: Venue managers cannot assign administrator roles"}), 403
 
     if new_user['role'] == 'venue_manager' and not new_user.get('venue_id'):
-        logdb_users_history(db, ObjectId(user_document['_id']), "add_user", None, "Missing required fields", "failed")
+        log_history("users", "add_user", "Missing required fields", "failed", user=ObjectId(user_document['_id']))
         return jsonify({"error": "Missing required fields"}), 400
 
     db.users.insert_one({
@@ -166,7 +171,9 @@ def add_user():
         'last_seen': None,
         'firstLogin': False
     })
+    invalidate_user(new_user['username'])
+    bump_generation(ALL_VENUES)
 
-    logdb_users_history(db, ObjectId(user_document['_id']), "add_user", None, f"Added user: {new_user['username']} with \"{new_user['role']}\" role to venue \"{user_document['venue_id']}\"")
+    log_history("users", "add_user", f"Added user: {new_user['username']} with \"{new_user['role']}\" role to venue \"{user_document['venue_id']}\"", user=ObjectId(user_document['_id']))
 
     return jsonify({"message": "User added successfully"}), 200
\ No newline at end of file
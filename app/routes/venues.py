@@ -1,21 +1,30 @@
 import re
 
-from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
+from flask import Blueprint, Response, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt
 from app.services.database import get_db
-from app.models import serialize_document
+from app.utils.http_cache import cached_response, etag_response
+from app.services.cache_service import ALL_VENUES, bump_generation
+from app.services.rules_service import RULE_FIELDS, build_rules, export_csv_rules, new_rule_id, parse_csv_rules
+from app.services.unallocated_service import get_unallocated_items, get_unallocated_locations
+from app.services.picking_area_service import (
+    get_picking_areas, invalidate_picking_areas, next_refresh_time, normalize_timestamp
+)
+from app.services.upstream_service import get_upstream_metrics
+from app.services.user_service import get_current_user
 import pytz
-from datetime import datetime, timedelta
+from datetime import datetime
 
 venues_bp = Blueprint('venues', __name__)
 
 
 @venues_bp.route('/', methods=['GET'])
 @jwt_required()
+@etag_response
+@cached_response(lambda: ALL_VENUES if (get_current_user() or {}).get('role') == "administrator" else None)
 def get_all_venues():
     db = get_db()
-    current_user = get_jwt_identity()
-    user_document = db.users.find_one({'username': current_user})
+    user_document = get_current_user()
 
     if not user_document:
         return jsonify({"error": "User not found"}), 404
@@ -28,7 +37,7 @@ def get_all_venues():
     start_of_today = now.replace(hour=0, minute=0, second=0, microsecond=0)
     end_of_today = now.replace(hour=23, minute=59, second=59, microsecond=999999)
 
-    venues = db.venue_settings.find({})
+    venues = db.venue_settings.find({}, {'unallocatedItems': 0})
     venue_list = []
 
     for venue in venues:
@@ -40,23 +49,32 @@ def get_all_venues():
         })
 
         # when the picking areas of the venue was last updated...
-        last_picking_areas_update = db.picking_areas.find_one({"venue_id": venue_id})['last_updated']
-        last_itemconfigs_update = db.item_configs.find_one({"venue_id": venue_id})['last_updated']
+        picking_areas = db.picking_areas.find_one({"venue_id": venue_id}, {'last_updated': 1}) or {}
+        last_picking_areas_update = normalize_timestamp(picking_areas.get('last_updated'))
+        last_itemconfigs_update = (db.item_configs.find_one({"venue_id": venue_id}, {'last_updated': 1}) or {}).get('last_updated')
 
         # how many users are assigned to this venue
         users_assigned = db.users.count_documents({"venue_id": venue_id})
 
-        venue_data = serialize_document(venue)
-        venue_data["usersAssignedCount"] = users_assigned
-        venue_data["itemsAssignedToday"] = str(today_assigned_count)
-        venue_data["lastItemConfigsUpdate"] = last_itemconfigs_update
-        venue_data["lastPickingAreasUpdate"] = last_picking_areas_update
-        venue_data['nextPickingAreasUpdate'] = last_picking_areas_update + timedelta(days=3)
-        venue_data['scheduleType'] = venue['schedule']['scheduleType']
-        venue_list.append(venue_data)
+        venue["usersAssignedCount"] = users_assigned
+        venue["itemsAssignedToday"] = str(today_assigned_count)
+        venue["lastItemConfigsUpdate"] = last_itemconfigs_update
+        venue["lastPickingAreasUpdate"] = last_picking_areas_update
+        venue['nextPickingAreasUpdate'] = next_refresh_time(picking_areas)
+        venue['scheduleType'] = venue['schedule']['scheduleType']
+        venue_list.append(venue)
 
     return jsonify(venue_list), 200
 
+@venues_bp.route('/upstream-metrics', methods=['GET'])
+@jwt_required()
+def upstream_metrics():
+    claims = get_jwt()
+    if claims.get('role') != 'administrator':
+        return jsonify({"error": "Unauthorized"}), 403
+
+    return jsonify(get_upstream_metrics()), 200
+
 @venues_bp.route('/<venue_id>', methods=['PUT'])
 @jwt_required()
 def update_venue(venue_id):
@@ -123,10 +141,15 @@ def update_venue(venue_id):
         if users_assigned > 0 and venue_id != update_data['venue_id']:
             return jsonify({"error": "Cannot change venue ID when users are assigned to this venue"}), 400
 
-    result = db.venue_settings.update_one(
-        {"venue_id": venue_id},
-        {"$set": cleaned_data}
-    )
+    update = {"$set": cleaned_data}
+    if any(rule_type in cleaned_data for rule_type in RULE_FIELDS):
+        update["$inc"] = {"rulesVersion": 1}
+
+    result = db.venue_settings.update_one({"venue_id": venue_id}, update)
+    if result.modified_count and ("endpoints" in cleaned_data or cleaned_data.get("venue_id", venue_id) != venue_id):
+        # the stored picking areas belong to the old upstream venue
+        invalidate_picking_areas(venue_id)
+    bump_generation(venue_id)
 
     if result.modified_count == 0:
         return jsonify({"message": "No changes were made"}), 200
@@ -136,6 +159,28 @@ def update_venue(venue_id):
         "modified_count": result.modified_count
     }), 200
 
+@venues_bp.route('/<venue_id>/picking-areas/refresh', methods=['POST'])
+@jwt_required()
+def refresh_venue_picking_areas(venue_id):
+    claims = get_jwt()
+    if claims.get('role') != 'administrator':
+        return jsonify({"error": "Unauthorized"}), 403
+
+    db = get_db()
+    if not db.venue_settings.find_one({"venue_id": venue_id}, {'_id': 1}):
+        return jsonify({"error": "Venue not found"}), 404
+
+    picking_areas = get_picking_areas(venue_id, force_refresh=True)
+    if not picking_areas:
+        return jsonify({"error": "Failed to refresh picking areas"}), 502
+
+    return jsonify({
+        "message": "Picking areas refreshed successfully",
+        "pickingAreasCount": len(picking_areas['picking_areas']),
+        "lastPickingAreasUpdate": picking_areas['last_updated'],
+        "nextPickingAreasUpdate": next_refresh_time(picking_areas)
+    }), 200
+
 @venues_bp.route('/<venue_id>/delete', methods=['DELETE'])
 @jwt_required()
 def delete_venue(venue_id):
@@ -145,11 +190,14 @@ def delete_venue(venue_id):
 
     db = get_db()
     db.venue_settings.delete_one({"venue_id": venue_id})
+    invalidate_picking_areas(venue_id)
+    bump_generation(venue_id)
     return jsonify({"message": "Venue deleted successfully"}), 200
 
 
 @venues_bp.route('/settings/<venue_id>', methods=['GET', 'POST'])
 @jwt_required()
+@etag_response
 def manage_venue_settings(venue_id):
     claims = get_jwt()
     if claims['venue_id'] != venue_id:
@@ -157,17 +205,41 @@ def manage_venue_settings(venue_id):
 
     db = get_db()
     if request.method == 'GET':
-        settings = db.venue_settings.find_one({"venue_id": venue_id}, {'_id': 0})
+        settings = db.venue_settings.find_one({"venue_id": venue_id}, {'_id': 0, 'unallocatedItems': 0})
         if settings:
             return jsonify(settings), 200
         else:
             return jsonify({"error": "Settings not found"}), 404
 
     update_data = request.json
-    db.venue_settings.update_one({"venue_id": venue_id}, {'$set': update_data}, upsert=True)
+    update_data.pop('rulesVersion', None)
+    update = {'$set': update_data}
+    if any(rule_type in update_data for rule_type in RULE_FIELDS):
+        update['$inc'] = {"rulesVersion": 1}
+    db.venue_settings.update_one({"venue_id": venue_id}, update, upsert=True)
+    if 'endpoints' in update_data:
+        invalidate_picking_areas(venue_id)
+    bump_generation(venue_id)
     return jsonify({"message": "Settings updated successfully"}), 200
 
 
+@venues_bp.route('/settings/<venue_id>/unallocated', methods=['GET'])
+@jwt_required()
+@etag_response
+def get_unallocated(venue_id):
+    claims = get_jwt()
+    if claims['venue_id'] != venue_id:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    location = request.args.get('location')
+    if location is None:
+        return jsonify({"locations": get_unallocated_locations(venue_id, limit=limit)}), 200
+
+    items, total = get_unallocated_items(venue_id, location=location, limit=limit, skip=request.args.get('skip', 0, type=int))
+    return jsonify({"location": location, "total": total, "items": items}), 200
+
+
 @venues_bp.route('/settings/<venue_id>/binmapping', methods=['POST'])
 @jwt_required()
 def add_bin_mapping(venue_id):
@@ -176,14 +248,12 @@ def add_bin_mapping(venue_id):
         return jsonify({"error": "Unauthorized"}), 403
 
     db = get_db()
-    current_data = db.venue_settings.find_one({"venue_id": venue_id}, {'binMappings': 1, '_id': 0})
-    current_mappings = current_data.get('binMappings', []) if current_data else []
-
-    new_id = str(len(current_mappings) + 1)
+    new_id = new_rule_id()
     bin_mapping = request.json
     bin_mapping['id'] = new_id
 
-    db.venue_settings.update_one({"venue_id": venue_id}, {'$push': {"binMappings": bin_mapping}}, upsert=True)
+    db.venue_settings.update_one({"venue_id": venue_id}, {'$push': {"binMappings": bin_mapping}, '$inc': {"rulesVersion": 1}}, upsert=True)
+    bump_generation(venue_id)
     return jsonify({"message": "Bin mapping added successfully", "id": new_id}), 200
 
 
@@ -195,7 +265,8 @@ def delete_bin_mapping(venue_id, bin_mapping_id):
         return jsonify({"error": "Unauthorized"}), 403
 
     db = get_db()
-    db.venue_settings.update_one({"venue_id": venue_id}, {'$pull': {"binMappings": {"id": bin_mapping_id}}})
+    db.venue_settings.update_one({"venue_id": venue_id}, {'$pull': {"binMappings": {"id": bin_mapping_id}}, '$inc': {"rulesVersion": 1}})
+    bump_generation(venue_id)
     return jsonify({"message": "Bin mapping deleted successfully"}), 200
 
 
@@ -207,14 +278,12 @@ def add_overflow_location(venue_id):
         return jsonify({"error": "Unauthorized"}), 403
 
     db = get_db()
-    current_data = db.venue_settings.find_one({"venue_id": venue_id}, {'overflowLocations': 1, '_id': 0})
-    current_overflows = current_data.get('overflowLocations', []) if current_data else []
-
-    new_id = str(len(current_overflows) + 1)
+    new_id = new_rule_id()
     overflow_data = request.json
     overflow_data['id'] = new_id
 
-    db.venue_settings.update_one({"venue_id": venue_id}, {'$push': {"overflowLocations": overflow_data}}, upsert=True)
+    db.venue_settings.update_one({"venue_id": venue_id}, {'$push': {"overflowLocations": overflow_data}, '$inc': {"rulesVersion": 1}}, upsert=True)
+    bump_generation(venue_id)
     return jsonify({"message": "Overflow location added successfully", "id": new_id}), 200
 
 
@@ -226,10 +295,86 @@ def delete_overflow_location(venue_id, overflow_id):
         return jsonify({"error": "Unauthorized"}), 403
 
     db = get_db()
-    db.venue_settings.update_one({"venue_id": venue_id}, {'$pull': {"overflowLocations": {"id": overflow_id}}})
+    db.venue_settings.update_one({"venue_id": venue_id}, {'$pull': {"overflowLocations": {"id": overflow_id}}, '$inc': {"rulesVersion": 1}})
+    bump_generation(venue_id)
     return jsonify({"message": "Overflow location deleted successfully"}), 200
 
 
+@venues_bp.route('/settings/<venue_id>/rules/export', methods=['GET'])
+@jwt_required()
+def export_rules(venue_id):
+    claims = get_jwt()
+    if claims['venue_id'] != venue_id:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    db = get_db()
+    projection = {rule_type: 1 for rule_type in RULE_FIELDS}
+    settings = db.venue_settings.find_one({"venue_id": venue_id}, {**projection, 'rulesVersion': 1, '_id': 0})
+    if not settings:
+        return jsonify({"error": "Venue not found"}), 404
+
+    if request.args.get('format', 'json') == 'csv':
+        return Response(
+            export_csv_rules(settings),
+            mimetype='text/csv',
+            headers={"Content-Disposition": f"attachment; filename={venue_id}-rules.csv"}
+        )
+
+    rules = {rule_type: settings.get(rule_type, []) for rule_type in RULE_FIELDS}
+    return jsonify({**rules, "rulesVersion": settings.get('rulesVersion', 0)}), 200
+
+
+@venues_bp.route('/settings/<venue_id>/rules/import', methods=['POST'])
+@jwt_required()
+def import_rules(venue_id):
+    claims = get_jwt()
+    if claims['venue_id'] != venue_id:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    mode = request.args.get('mode', 'merge')
+    if mode not in ['merge', 'replace']:
+        return jsonify({"error": "Mode must be merge or replace"}), 400
+
+    # csv as an uploaded file or a text/csv body, otherwise a json object with the three rule lists
+    errors = []
+    if 'file' in request.files or request.mimetype == 'text/csv':
+        data = request.files['file'].read() if 'file' in request.files else request.get_data()
+        try:
+            imported, errors = parse_csv_rules(data.decode('utf-8-sig'))
+        except UnicodeDecodeError:
+            return jsonify({"error": "CSV must be UTF-8 encoded"}), 400
+    else:
+        imported = request.get_json(silent=True)
+        if not isinstance(imported, dict):
+            return jsonify({"error": "Expected a JSON object or a CSV file"}), 400
+
+    db = get_db()
+    projection = {rule_type: 1 for rule_type in RULE_FIELDS}
+    settings = db.venue_settings.find_one({"venue_id": venue_id}, {**projection, 'rulesVersion': 1, '_id': 0})
+    if not settings:
+        return jsonify({"error": "Venue not found"}), 404
+
+    rules, report, validation_errors = build_rules(settings, imported, mode)
+    errors += validation_errors
+    if errors:
+        return jsonify({"error": "Import rejected", "errorsCount": len(errors), "errors": errors[:100]}), 400
+
+    if request.args.get('dry_run') == 'true':
+        return jsonify({"message": "Import validated", "report": report}), 200
+
+    # single atomic update, rejected if the rules changed since they were read
+    version = settings.get('rulesVersion')
+    result = db.venue_settings.update_one(
+        {"venue_id": venue_id, "rulesVersion": version},
+        {'$set': rules, '$inc': {"rulesVersion": 1}}
+    )
+    if result.matched_count == 0:
+        return jsonify({"error": "Rules were modified concurrently, please retry"}), 409
+
+    bump_generation(venue_id)
+    return jsonify({"message": "Rules imported successfully", "report": report}), 200
+
+
 @venues_bp.route('/settings/<venue_id>/schedule', methods=['POST'])
 @jwt_required()
 def update_schedule(venue_id):
@@ -240,6 +385,7 @@ def update_schedule(venue_id):
     db = get_db()
     schedule_data = request.json
     db.venue_settings.update_one({"venue_id": venue_id}, {'$set': {"schedule": schedule_data}}, upsert=True)
+    bump_generation(venue_id)
     return jsonify({"message": "Schedule updated successfully"}), 200
 
 # TODO: add routing for reset to defaults for venue settings, meaning, clear all settings for a venue, but keep the venue ID
@@ -272,7 +418,8 @@ def reset_settings(venue_id):
                 "selectedDays": [],
             },
             "venue_message": [],
-        }}
+        }, '$inc': {"rulesVersion": 1}}
     )
+    bump_generation(venue_id)
 
     return jsonify({"message": "Settings have been reset successfully"}), 200
@@ -0,0 +1,40 @@
+from flask import Blueprint, jsonify, request
+from app.config import Config
+from app.services.webhook_service import enqueue_item_events, register_delivery, verify_signature
+
+webhooks_bp = Blueprint('webhooks', __name__)
+
+
+@webhooks_bp.route('/items/<venue_id>', methods=['POST'])
+def item_events(venue_id):
+    if not Config.WEBHOOK_SECRET:
+        return jsonify({"error": "Webhooks are not enabled"}), 503
+
+    delivery_id = request.headers.get('X-Delivery-Id', '')
+    signed = verify_signature(
+        venue_id, request.get_data(), request.headers.get('X-Signature', ''),
+        request.headers.get('X-Timestamp', ''), delivery_id
+    )
+    if not signed:
+        return jsonify({"error": "Invalid or expired signature"}), 401
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"error": "Invalid payload"}), 400
+
+    # either {"events": [...]} or a single item.created / item.updated event
+    events = payload.get("events", [payload])
+    if not isinstance(events, list):
+        return jsonify({"error": "Invalid payload"}), 400
+
+    received = len(events)
+    events = [
+        event for event in events
+        if isinstance(event, dict) and event.get("type", "item.updated") in ["item.created", "item.updated"]
+    ]
+    # registered only once the payload is known to be valid, a rejected delivery can be sent again
+    if not register_delivery(venue_id, delivery_id):
+        # already received, acknowledged so the sender stops retrying
+        return jsonify({"accepted": 0, "duplicate": True}), 200
+    accepted = enqueue_item_events(venue_id, events)
+    return jsonify({"accepted": accepted, "ignored": received - accepted}), 202
@@ -0,0 +1,391 @@
+import asyncio
+import hashlib
+import json
+import time
+
+from app.config import Config
+from app.services.cache_service import bump_generation
+from app.services.item_service import (
+    accepted_items, build_assignment_records, check_lease, index_catalog, inputs_key, match_items,
+    process_and_attach_items, select_changed_items
+)
+from app.services.picking_area_service import get_picking_areas
+from app.services.pipeline_service import (
+    OPEN_STATUSES, LeaseLost, checkpoint_pipeline_run, finish_pipeline_run, save_assignment_set, start_pipeline_run
+)
+from app.services.queue_service import acquire_lease, new_worker_id, release_lease, start_heartbeat
+from app.services.snapshot_service import load_snapshot, save_snapshot
+from app.services.token_service import get_access_token
+from app.services.unallocated_service import record_unallocated
+from app.services.upstream_service import (
+    NOT_MODIFIED, UpstreamUnavailable, _get_breaker, _get_limiter, _parse_retry_after
+)
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+import pytz
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:
+    AsyncIOMotorClient = None
+
+
+class AsyncEngine:
+    # runs many venues in one event loop. Upstream calls share one client, a global budget of requests
+    # in flight and the host limiters of upstream_service, mongo round trips go through motor, and
+    # cpu-bound steps (matching, snapshot compression) plus the lease and cache helpers run in the
+    # default thread pool
+
+    def __init__(self):
+        if httpx is None or AsyncIOMotorClient is None:
+            raise RuntimeError("EXECUTION_ENGINE=async requires the httpx and motor packages")
+        self.http = httpx.AsyncClient(
+            timeout=Config.UPSTREAM_TIMEOUT,
+            limits=httpx.Limits(max_connections=Config.ASYNC_HTTP_CONCURRENCY)
+        )
+        self.mongo = AsyncIOMotorClient(Config.MONGO_URI)
+        self.db = self.mongo.get_default_database()
+        self.requests = asyncio.Semaphore(Config.ASYNC_HTTP_CONCURRENCY)
+        self.venues = asyncio.Semaphore(Config.ASYNC_VENUE_CONCURRENCY)
+        # venue_id -> lost event of the venue's lease heartbeat
+        self.leases = {}
+
+    async def close(self):
+        await self.http.aclose()
+        self.mongo.close()
+
+    async def request(self, method, url, venue_id=None, lease_lost=None, **kwargs):
+        # the same per-host limiters and per-venue circuit breakers as the synchronous upstream_request,
+        # so both engines and the threads of this process share one budget per host
+        parsed = urlparse(url)
+        host = f"{parsed.scheme}://{parsed.netloc}"
+        breaker = _get_breaker(venue_id or host)
+        if not breaker.allow():
+            raise UpstreamUnavailable(f"Circuit open for {venue_id or host}, skipping {method} {url}")
+
+        limiter = _get_limiter(host)
+        acquired = False
+        try:
+            async with self.requests:
+                # a batch may have waited for a slot longer than the lease lasted
+                check_lease(venue_id, lease_lost)
+                await limiter.acquire_async()
+                acquired = True
+                response = await self.http.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            limiter.release(failed=True)
+            breaker.record(True)
+            raise
+        except BaseException:
+            # cancelled or the lease was lost before the upstream answered, there is no outcome to record
+            if acquired:
+                limiter.cancel()
+            breaker.cancel_trial()
+            raise
+
+        throttled = response.status_code == 429
+        failed = throttled or response.status_code >= 500
+        limiter.release(failed, throttled, _parse_retry_after(response.headers.get("Retry-After")))
+        breaker.record(failed)
+        return response
+
+    async def conditional_get(self, venue_id, endpoint, url, headers, pending):
+        # mirrors upstream_service.conditional_get, the validators are shared with the sync engine and
+        # collected in pending until the run completed
+        validators = await self.db.fetch_validators.find_one({"venue_id": venue_id, "endpoint": endpoint}) or {}
+        request_headers = dict(headers)
+        if validators.get("etag"):
+            request_headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            request_headers["If-Modified-Since"] = validators["last_modified"]
+
+        response = await self.request("GET", url, venue_id=venue_id, headers=request_headers)
+        if response.status_code == 304:
+            return response, False
+        if response.status_code != 200:
+            return response, True
+
+        content_hash = hashlib.sha256(response.content).hexdigest()
+        pending[endpoint] = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_hash": content_hash,
+        }
+        return response, content_hash != validators.get("content_hash")
+
+    async def commit_validators(self, venue_id, pending):
+        for endpoint, validators in pending.items():
+            await self._save_validators(venue_id, endpoint, validators)
+
+    async def _save_validators(self, venue_id, endpoint, validators):
+        await self.db.fetch_validators.update_one(
+            {"venue_id": venue_id, "endpoint": endpoint},
+            {"$set": {**validators, "last_checked": datetime.now(pytz.utc)}},
+            upsert=True
+        )
+
+    async def fetch(self, venue_id, endpoint, url, headers, conditional, pending=None):
+        if conditional:
+            response, changed = await self.conditional_get(venue_id, endpoint, url, headers, pending)
+            if not changed:
+                return NOT_MODIFIED
+        else:
+            response = await self.request("GET", url, venue_id=venue_id, headers=headers)
+
+        if response.status_code != 200:
+            print(f"Error fetching {endpoint}: {response.status_code}, {response.text}")
+            response.raise_for_status()
+        # decoding a large payload is cpu-bound
+        return await asyncio.to_thread(response.json)
+
+    async def run(self, venue_ids, force=False):
+        results = await asyncio.gather(*[self.run_venue(venue_id, force) for venue_id in venue_ids])
+        return dict(zip(venue_ids, results))
+
+    async def run_venue(self, venue_id, force=False):
+        async with self.venues:
+            owner = new_worker_id()
+            if not await asyncio.to_thread(acquire_lease, venue_id, owner):
+                print(f"Venue {venue_id} is already running on another worker, skipping")
+                return {"status": "skipped", "reason": "Already running on another worker"}
+
+            stop, lost = start_heartbeat(venue_id, owner)
+            self.leases[venue_id] = lost
+            try:
+                return await asyncio.wait_for(self._run_venue(venue_id, force), Config.ASYNC_VENUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                # the cancelled run stays open and resumable, a resume still working in a thread
+                # stops at its next batch
+                lost.set()
+                print(f"Async run for venue {venue_id} timed out after {Config.ASYNC_VENUE_TIMEOUT}s")
+                return {"status": "failed", "error": "Timed out"}
+            except LeaseLost as e:
+                print(f"Async run aborted for venue {venue_id}: {e}")
+                return {"status": "aborted", "error": str(e)}
+            except Exception as e:
+                print(f"Async run failed for venue {venue_id}: {e}")
+                return {"status": "failed", "error": str(e)}
+            finally:
+                stop.set()
+                self.leases.pop(venue_id, None)
+                await asyncio.to_thread(release_lease, venue_id, owner)
+
+    async def _run_venue(self, venue_id, force):
+        venue_settings = await self.db.venue_settings.find_one({"venue_id": venue_id}, {"rulesVersion": 1}) or {}
+        rules_version = venue_settings.get("rulesVersion", 0)
+        if not force:
+            cutoff = datetime.now(pytz.utc) - timedelta(seconds=Config.PIPELINE_RESUME_WINDOW)
+            resumable = await self.db.pipeline_runs.find_one({
+                "venue_id": venue_id, "status": {"$in": OPEN_STATUSES}, "stage": "attaching",
+                "rules_version": rules_version, "updated_at": {"$gte": cutoff},
+            }, {"_id": 1})
+            if resumable:
+                # resuming an interrupted attach is left to the synchronous pipeline
+                return await asyncio.to_thread(process_and_attach_items, venue_id, lease_lost=self.leases.get(venue_id))
+
+        run, _ = await asyncio.to_thread(start_pipeline_run, venue_id, False, rules_version)
+        run_id = run["_id"]
+        try:
+            result = await self._pipeline(venue_id, run_id, force)
+        except LeaseLost:
+            # left open for the worker that holds the lease now
+            raise
+        except Exception as e:
+            await asyncio.to_thread(finish_pipeline_run, run_id, "interrupted", None, str(e))
+            raise
+        await asyncio.to_thread(finish_pipeline_run, run_id, result["status"], result)
+        return {**result, "runId": run_id}
+
+    async def _pipeline(self, venue_id, run_id, force):
+        async def report(stage, **counts):
+            check_lease(venue_id, self.leases.get(venue_id))
+            await asyncio.to_thread(checkpoint_pipeline_run, run_id, stage, counts)
+
+        venue_settings = await self.db.venue_settings.find_one({"venue_id": venue_id}, {"unallocatedItems": 0})
+        if not venue_settings:
+            return {"status": "skipped", "reason": "Venue not found"}
+
+        await report("picking_areas")
+        picking_areas = await asyncio.to_thread(get_picking_areas, venue_id)
+        if not picking_areas:
+            return {"status": "skipped", "reason": "No picking areas"}
+
+        endpoints = venue_settings['endpoints']
+        headers = {
+            "Authorization": f"Bearer {await asyncio.to_thread(get_access_token)}",
+            "Content-Type": "application/json",
+        }
+
+        # skipped only when the payloads, the rules and the picking areas are unchanged, like the sync pipeline
+        inputs = inputs_key(venue_settings, picking_areas)
+        stored_inputs = await self.db.fetch_validators.find_one({"venue_id": venue_id, "endpoint": "inputs"}) or {}
+        pending = {}
+
+        # both payloads are downloaded concurrently
+        await report("item_configs")
+        item_configs_url = f"{endpoints['BASE_URL']}{endpoints['ITEM_CONFIG_ENDPOINT']}?menuId={endpoints['MENU_ID']}"
+        unassigned_items_url = f"{endpoints['BASE_URL']}{endpoints['UNASSIGNED_ITEMS_ENDPOINT']}"
+        item_configs, unassigned_items = await asyncio.gather(
+            self.fetch(venue_id, "item_configs", item_configs_url, headers, not force, pending),
+            self.fetch(venue_id, "unassigned_items", unassigned_items_url, headers, not force, pending),
+        )
+        if (item_configs is NOT_MODIFIED and unassigned_items is NOT_MODIFIED
+                and stored_inputs.get("key") == inputs["key"]):
+            print(f"Upstream data unchanged for venue: {venue_id}, skipping run")
+            return {"status": "skipped", "reason": "Upstream data unchanged"}
+
+        if item_configs is NOT_MODIFIED:
+            item_configs = await asyncio.to_thread(load_snapshot, "item_configs", venue_id)
+            if item_configs is None:
+                item_configs = await self.fetch(venue_id, "item_configs", item_configs_url, headers, False)
+                if item_configs:
+                    await asyncio.to_thread(save_snapshot, "item_configs", venue_id, item_configs, len(item_configs))
+        elif item_configs:
+            await asyncio.to_thread(save_snapshot, "item_configs", venue_id, item_configs, len(item_configs))
+        if unassigned_items is NOT_MODIFIED:
+            unassigned_items = await asyncio.to_thread(load_snapshot, "unassigned_items", venue_id)
+            if unassigned_items is None:
+                unassigned_items = await self.fetch(venue_id, "unassigned_items", unassigned_items_url, headers, False)
+                if unassigned_items:
+                    await asyncio.to_thread(
+                        save_snapshot, "unassigned_items", venue_id, unassigned_items, len(unassigned_items['data'])
+                    )
+        elif unassigned_items:
+            await asyncio.to_thread(
+                save_snapshot, "unassigned_items", venue_id, unassigned_items, len(unassigned_items['data'])
+            )
+
+        if not item_configs:
+            return {"status": "skipped", "reason": "No item configs"}
+        if not unassigned_items:
+            await self.commit_validators(venue_id, {**pending, "inputs": inputs})
+            return {"status": "skipped", "reason": "No unassigned items"}
+
+        await report("matching", itemConfigs=len(item_configs), unassignedItems=len(unassigned_items['data']))
+        assigned_items, unavailable_items, unallocated_items = await asyncio.to_thread(
+            match_items, venue_settings, unassigned_items, item_configs, picking_areas['picking_areas']
+        )
+        await asyncio.to_thread(record_unallocated, venue_id, unallocated_items)
+
+        await report("all_items", assigned=len(assigned_items), unavailable=len(unavailable_items))
+        all_items_information = await self.fetch(
+            venue_id, "all_items", endpoints['ALL_ITEMS_INFORMATION_ENDPOINT'], headers, False
+        )
+        if not all_items_information:
+            return {"status": "skipped", "reason": "No all items information"}
+        await asyncio.to_thread(_write_catalog_file, venue_id, all_items_information)
+
+        previous_assignments = {}
+        async for assignment in self.db.item_assignments.find(
+            {"venue_id": venue_id, "item_id": {"$in": [item["itemId"] for item in assigned_items]}},
+            {"_id": 0, "item_id": 1, "picking_area_id": 1, "picking_area_name": 1}
+        ):
+            previous_assignments[assignment["item_id"]] = assignment
+        # every matched item is attached again, the delta only decides what is journaled
+        changed_items = select_changed_items(assigned_items, previous_assignments)
+        await asyncio.to_thread(save_assignment_set, run_id, assigned_items)
+
+        await report("attaching", assigned=len(assigned_items), unavailable=len(unavailable_items), changed=len(changed_items))
+        attached_items = await self.attach(
+            venue_id, run_id, endpoints, headers, assigned_items, previous_assignments,
+            index_catalog(all_items_information)
+        )
+        await asyncio.to_thread(bump_generation, venue_id)
+        if not Config.ATTACH_ITEMS or len(attached_items) == len(assigned_items):
+            await self.commit_validators(venue_id, {**pending, "inputs": inputs})
+        else:
+            print(f"{len(assigned_items) - len(attached_items)} items were not attached for venue: {venue_id}, keeping the validators")
+
+        return {
+            "status": "completed",
+            "itemConfigs": len(item_configs),
+            "unassignedItems": len(unassigned_items['data']),
+            "assigned": len(assigned_items),
+            "unavailable": len(unavailable_items),
+            "unallocated": len(unallocated_items),
+            "changed": len(changed_items),
+            "attached": len(attached_items),
+            "dryRun": not Config.ATTACH_ITEMS,
+        }
+
+    async def attach(self, venue_id, run_id, endpoints, headers, items, previous_assignments, catalog):
+        # batches of every picking area are posted concurrently within the global request budget
+        items_by_area = {}
+        for item in items:
+            items_by_area.setdefault(item["pickingAreaId"], []).append(item)
+
+        batches = [
+            (picking_area_id, area_items[start:start + Config.ATTACH_BATCH_SIZE])
+            for picking_area_id, area_items in items_by_area.items()
+            for start in range(0, len(area_items), Config.ATTACH_BATCH_SIZE)
+        ]
+        results = await asyncio.gather(*[
+            self.attach_batch(venue_id, run_id, endpoints, headers, picking_area_id, batch, previous_assignments, catalog)
+            for picking_area_id, batch in batches
+        ], return_exceptions=True)
+
+        lost = next((result for result in results if isinstance(result, LeaseLost)), None)
+        if lost:
+            raise lost
+
+        attached_items = []
+        for (picking_area_id, batch), result in zip(batches, results):
+            if isinstance(result, Exception):
+                print(f"Failed to assign {len(batch)} items to picking area {picking_area_id}: {result}")
+            else:
+                attached_items.extend(result)
+        return attached_items
+
+    async def attach_batch(self, venue_id, run_id, endpoints, headers, picking_area_id, batch, previous_assignments, catalog):
+        # returns the accepted items of the batch, a dry run records nothing (see attach_items_to_picking_routes)
+        if not Config.ATTACH_ITEMS:
+            print(f"Dry run, would assign {len(batch)} items to picking area {picking_area_id}")
+            return []
+
+        url = f"{endpoints['BASE_URL']}/v1/venues/{endpoints['VENUE_ID']}/picking-areas/{picking_area_id}/items"
+        response = await self.request(
+            "POST", url, venue_id=venue_id, lease_lost=self.leases.get(venue_id), headers=headers,
+            json={"data": [item["itemId"] for item in batch]}
+        )
+        accepted = accepted_items(response, batch)
+        if len(accepted) < len(batch):
+            print(f"Failed to assign {len(batch) - len(accepted)} of {len(batch)} items to picking area {picking_area_id}: {response.text}")
+        if not accepted:
+            return []
+
+        # journaled and checkpointed per batch, like the synchronous pipeline
+        journal, operations = build_assignment_records(venue_id, accepted, previous_assignments, catalog)
+        if journal:
+            await self.db.item_updates.insert_many(journal, ordered=False)
+        await self.db.item_assignments.bulk_write(operations, ordered=False)
+        await self.db.pipeline_runs.update_one({"_id": run_id}, {
+            "$addToSet": {"batches": f"{picking_area_id}:{accepted[0]['itemId']}"},
+            "$inc": {"attached": len(accepted)},
+            "$set": {"updated_at": datetime.now(pytz.utc)},
+        })
+        return accepted
+
+
+def _write_catalog_file(venue_id, all_items_information):
+    with open(f"{venue_id}.json", 'w') as file:
+        json.dump(all_items_information, file)
+
+
+def run_venues_async(venue_ids, force=False):
+    # blocking entry point for the scheduler and the cli, returns {venue_id: result}
+    async def main():
+        engine = AsyncEngine()
+        try:
+            return await engine.run(venue_ids, force)
+        finally:
+            await engine.close()
+
+    started = time.perf_counter()
+    results = asyncio.run(main())
+    print(f"Async engine ran {len(venue_ids)} venues in {round(time.perf_counter() - started, 3)}s")
+    return results
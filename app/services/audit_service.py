@@ -0,0 +1,126 @@
+import atexit
+import queue
+import threading
+import time
+
+from app.config import Config
+from app.services.database import get_db
+from app.utils.helpers import get_current_time
+from pymongo.errors import BulkWriteError, PyMongoError
+
+_queue = queue.Queue(maxsize=Config.AUDIT_QUEUE_SIZE)
+_writer = None
+_writer_lock = threading.Lock()
+_stopping = threading.Event()
+# put by flush_audit so that a writer waiting for events notices the stop right away
+_WAKE = object()
+_stats = {"written": 0, "dropped": 0, "failed": 0}
+
+
+def log_history(scheme, action, message, status="success", user=None, target=None):
+    event = {
+        "scheme": scheme,
+        "user": user,
+        "action": action,
+        "target": target,
+        "message": message,
+        "status": status,
+        "timestamp": get_current_time()
+    }
+
+    # a full queue slows the caller down for a moment before the event is dropped
+    try:
+        _queue.put(event, timeout=Config.AUDIT_ENQUEUE_TIMEOUT)
+    except queue.Full:
+        _stats["dropped"] += 1
+        print(f"Audit queue full, dropped {action} event ({_stats['dropped']} dropped so far)")
+        return
+
+    _ensure_writer()
+
+
+def _write(events):
+    # retried a few times before the events are dropped. insert_many sets the _id of every event, so
+    # the events a failed attempt already inserted come back as duplicates on the next one
+    if not events:
+        return
+    for attempt in range(Config.AUDIT_WRITE_RETRIES + 1):
+        try:
+            get_db().history.insert_many(events, ordered=False)
+            _stats["written"] += len(events)
+            return
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if errors and all(error.get("code") == 11000 for error in errors):
+                _stats["written"] += len(events)
+                return
+            error = e
+        except PyMongoError as e:
+            error = e
+        if attempt < Config.AUDIT_WRITE_RETRIES:
+            time.sleep(0.5 * 2 ** attempt)
+
+    _stats["failed"] += len(events)
+    print(f"Failed to write {len(events)} audit events: {error}")
+
+
+def _next_batch():
+    # waits for the first event, then collects until the batch is full or the interval passed.
+    # once flush_audit stopped the writer it only takes what is already queued
+    try:
+        batch = [_queue.get(timeout=Config.AUDIT_FLUSH_INTERVAL)]
+    except queue.Empty:
+        return []
+    deadline = time.monotonic() + Config.AUDIT_FLUSH_INTERVAL
+    while len(batch) < Config.AUDIT_BATCH_SIZE:
+        remaining = 0 if _stopping.is_set() else deadline - time.monotonic()
+        try:
+            batch.append(_queue.get(timeout=remaining) if remaining > 0 else _queue.get_nowait())
+        except queue.Empty:
+            break
+    return [event for event in batch if event is not _WAKE]
+
+
+def _writer_loop():
+    while not (_stopping.is_set() and _queue.empty()):
+        _write(_next_batch())
+
+
+def _ensure_writer():
+    global _writer
+    if _writer is not None and _writer.is_alive():
+        return
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _stopping.clear()
+            _writer = threading.Thread(target=_writer_loop, name="audit-writer", daemon=True)
+            _writer.start()
+
+
+def flush_audit(timeout=30):
+    # the writer writes its current batch and whatever is queued, then exits
+    _stopping.set()
+    writer = _writer
+    if writer is not None and writer.is_alive():
+        try:
+            _queue.put_nowait(_WAKE)
+        except queue.Full:
+            pass
+        writer.join(timeout)
+        if writer.is_alive():
+            print("Audit writer did not finish in time, writing the queued events directly")
+
+    events = []
+    while True:
+        try:
+            events.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    _write([event for event in events if event is not _WAKE])
+
+
+def get_audit_stats():
+    return {**_stats, "queued": _queue.qsize()}
+
+
+atexit.register(flush_audit)
@@ -0,0 +1,79 @@
+import threading
+import time
+
+from app.config import Config
+from app.services.database import get_db
+from collections import OrderedDict
+from pymongo import UpdateOne
+
+# generation of every venue plus one shared by the cross-venue responses, bumped by each venue
+ALL_VENUES = "__all__"
+
+# key -> (venue generation, stored at, body, etag), least recently used first
+_responses = OrderedDict()
+_size = 0
+_lock = threading.Lock()
+
+# venue_id -> (generation, read at), avoids a generation lookup on every request
+_generations = {}
+
+
+def bump_generation(venue_id):
+    # every process drops the cached responses of the venue on its next read
+    db = get_db()
+    db.cache_generations.bulk_write([
+        UpdateOne({"_id": key}, {"$inc": {"generation": 1}}, upsert=True)
+        for key in [venue_id, ALL_VENUES]
+    ], ordered=False)
+    with _lock:
+        _generations.pop(venue_id, None)
+        _generations.pop(ALL_VENUES, None)
+
+
+def get_generation(venue_id):
+    now = time.monotonic()
+    cached = _generations.get(venue_id)
+    if cached and now - cached[1] < Config.CACHE_GENERATION_TTL:
+        return cached[0]
+
+    document = get_db().cache_generations.find_one({"_id": venue_id}) or {}
+    generation = document.get("generation", 0)
+    _generations[venue_id] = (generation, now)
+    return generation
+
+
+def get_response(key, generation):
+    with _lock:
+        entry = _responses.get(key)
+        if entry is None:
+            return None
+        if entry[0] != generation or time.monotonic() - entry[1] > Config.RESPONSE_CACHE_TTL:
+            _remove(key)
+            return None
+        _responses.move_to_end(key)
+        return entry[2], entry[3]
+
+
+def store_response(key, generation, body, etag):
+    global _size
+    if len(body) > Config.RESPONSE_CACHE_MAX_BYTES // 10:
+        return
+
+    with _lock:
+        _remove(key)
+        _responses[key] = (generation, time.monotonic(), body, etag)
+        _size += len(body)
+        while len(_responses) > Config.RESPONSE_CACHE_SIZE or _size > Config.RESPONSE_CACHE_MAX_BYTES:
+            _remove(next(iter(_responses)))
+
+
+def _remove(key):
+    global _size
+    entry = _responses.pop(key, None)
+    if entry is not None:
+        _size -= len(entry[2])
+
+
+def get_cache_stats():
+    with _lock:
+        return {"entries": len(_responses), "bytes": _size}
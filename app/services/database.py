@@ -1,9 +1,30 @@
+import threading
+
 from pymongo import MongoClient
-from flask import g
+from flask import g, has_app_context
 from app.config import Config
 
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(Config.MONGO_URI)
+    return _client
+
+def reset_client():
+    # called after a fork, pymongo clients must not be shared with the parent process
+    global _client
+    with _client_lock:
+        _client = None
+
 def get_db():
+    # scheduler jobs and background refreshes run outside of a request context
+    if not has_app_context():
+        return get_client().get_database()
     if 'db' not in g:
-        client = MongoClient(Config.MONGO_URI)
-        g.db = client.get_database()
+        g.db = get_client().get_database()
     return g.db
@@ -1,13 +1,29 @@
+import hashlib
 import json
 
+from app.config import Config
+from app.models import CompiledRules, load_item_configs, load_picking_areas, load_unassigned_ids
+from app.services.cache_service import bump_generation
 from app.services.database import get_db
+from app.services.picking_area_service import get_picking_areas
+from app.services.pipeline_service import (
+    LeaseLost, checkpoint_pipeline_run, finish_pipeline_run, load_assignment_set, record_pipeline_batch,
+    save_assignment_set, start_pipeline_run
+)
+from app.services.snapshot_service import get_snapshot_info, load_snapshot, save_snapshot
 from app.services.token_service import get_access_token
-from datetime import datetime, timedelta
+from app.services.unallocated_service import record_unallocated
+from app.services.upstream_service import (
+    NOT_MODIFIED, commit_validators, conditional_get, get_validators, upstream_request
+)
+from datetime import datetime
+from pymongo import UpdateOne
 import pytz
-import requests
 
+_assignment_indexes_ready = False
 
-def fetch_unassigned_items(venue_id):
+
+def fetch_unassigned_items(venue_id, conditional=False, pending=None):
     # validate if the venue exists
     db = get_db()
     venue_settings = db.venue_settings.find_one({"venue_id": venue_id})
@@ -25,7 +41,12 @@ def fetch_unassigned_items(venue_id):
         "Content-Type": "application/json",
     }
 
-    response = requests.get(url, headers=headers)
+    if conditional:
+        response, changed = conditional_get(venue_id, "unassigned_items", url, headers, pending)
+        if not changed:
+            return NOT_MODIFIED
+    else:
+        response = upstream_request("GET", url, venue_id=venue_id, headers=headers)
 
     if response.status_code == 200:
         return response.json()
@@ -34,7 +55,31 @@ def fetch_unassigned_items(venue_id):
         response.raise_for_status()
 
 
-def fetch_itemconfigs(venue_id):
+def check_unassigned_items_signal(venue_id):
+    # cheap change check for adaptive schedules, kept under its own validator key so that
+    # polling does not consume the validators of the run's own conditional fetch
+    db = get_db()
+    venue_settings = db.venue_settings.find_one({"venue_id": venue_id}, {"endpoints": 1})
+    if not venue_settings:
+        print(f"Venue not found: {venue_id} in check_unassigned_items_signal")
+        return False
+
+    BASE_URL = venue_settings['endpoints']['BASE_URL']
+    UNASSIGNED_ITEMS_ENDPOINT = venue_settings['endpoints']['UNASSIGNED_ITEMS_ENDPOINT']
+    url = f"{BASE_URL}{UNASSIGNED_ITEMS_ENDPOINT}"
+    headers = {
+        "Authorization": f"Bearer {get_access_token()}",
+        "Content-Type": "application/json",
+    }
+
+    response, changed = conditional_get(venue_id, "signal", url, headers)
+    if response.status_code not in [200, 304]:
+        print(f"Error checking unassigned items: {response.status_code}, {response.text}")
+        response.raise_for_status()
+    return changed
+
+
+def fetch_itemconfigs(venue_id, conditional=False, pending=None):
     db = get_db()
     venue_settings = db.venue_settings.find_one({"venue_id": venue_id})
     if not venue_settings:
@@ -52,7 +97,12 @@ def fetch_itemconfigs(venue_id):
         "Content-Type": "application/json",
     }
 
-    response = requests.get(url, headers=headers)
+    if conditional:
+        response, changed = conditional_get(venue_id, "item_configs", url, headers, pending)
+        if not changed:
+            return NOT_MODIFIED
+    else:
+        response = upstream_request("GET", url, venue_id=venue_id, headers=headers)
 
     if response.status_code == 200:
         return response.json()
@@ -63,105 +113,59 @@ def fetch_itemconfigs(venue_id):
 
 def process_unassigned_items(venue_id, unassigned_items, item_configs, picking_areas):
     db = get_db()
-    venue_settings = db.venue_settings.find_one({"venue_id": venue_id})
+    venue_settings = db.venue_settings.find_one({"venue_id": venue_id}, {"unallocatedItems": 0})
     if not venue_settings:
         print(f"Venue not found: {venue_id} in process_unassigned_items (subfunction)")
         return
 
-    picking_area_map = {area["name"].upper(): area["id"] for area in picking_areas}
-    unassigned_items = unassigned_items['data']  # the data is in the 'data' field
-    binMappings = venue_settings['binMappings']
-    renamed_locations = {}
-    for mapping in binMappings:
-        bin_location = mapping['binLocation']
-        picking_area = mapping['pickingArea']
-        renamed_locations[bin_location] = picking_area
+    assigned_items, unavailable_items, unallocated_items = match_items(venue_settings, unassigned_items, item_configs, picking_areas)
+    record_unallocated(venue_id, unallocated_items)
 
-    itemconfigs_map = {item["itemId"]: item for item in item_configs}
-    picking_area_names = {area["id"]: area["name"] for area in picking_areas}
+    return assigned_items, unavailable_items, unallocated_items
+
+
+def match_items(venue_settings, unassigned_items, item_configs, picking_areas):
+    # no database access, returns (assigned items, ids of unavailable items, items with an unallocated location)
+    rules = CompiledRules.from_settings(venue_settings)
+    item_locations = load_item_configs(item_configs)
+    picking_area_index = load_picking_areas(picking_areas)
 
     assigned_items = []
     unavailable_items = []
+    unallocated_items = []
 
-    db.venue_settings.update_one(
-        {"venue_id": venue_id},
-        {"$set": {"unallocatedItems": []}}
-    )
+    for item_id in load_unassigned_ids(unassigned_items):
+        storage_location = item_locations.location(item_id)
 
-    for unassigned in unassigned_items:
-        item_id = unassigned["id"]
-        item = itemconfigs_map.get(item_id)
-
-        if not item:
-            unavailable_items.append(unassigned)
+        if storage_location is None:
+            unavailable_items.append(item_id)
             continue
 
-        storage_location = item.get("storageLocation", "")
-        picking_area_id = get_best_picking_area(venue_id, storage_location, picking_area_map, renamed_locations)
+        picking_area_id = get_best_picking_area(rules, storage_location, picking_area_index)
 
         if storage_location and picking_area_id is None:
             print(f"{item_id} not assigned due to unallocated picking route.")
-
-            db.venue_settings.update_one(
-                {"venue_id": venue_id},
-                {"$push": {"unallocatedItems": item_id}}
-            )
-
+            unallocated_items.append({
+                "itemId": item_id,
+                "storageLocation": storage_location,
+                "normalizedLocation": next(rules.resolve(storage_location), ""),
+            })
 
         if picking_area_id:
             assigned_items.append({
                 "itemId": item_id,
                 "pickingAreaId": picking_area_id,
-                "pickingAreaName": picking_area_names.get(picking_area_id, "Unknown"),
+                "pickingAreaName": picking_area_index.name_of(picking_area_id),
                 "storageLocation": storage_location,
             })
         else:
-            unavailable_items.append(unassigned)
+            unavailable_items.append(item_id)
 
-    return assigned_items, unavailable_items
+    return assigned_items, unavailable_items, unallocated_items
 
-def normalize_location(location):
-    if "-" in location:
-        return "-".join(location.split("-")[:2])
-    return location
-
-def get_best_picking_area(venue_id, storage_location, picking_area_map, renamed_locations):
-    db = get_db()
-    venue_settings = db.venue_settings.find_one({"venue_id": venue_id})
-    if not venue_settings:
-        print(f"Venue not found: {venue_id} in get_best_picking_area (sub-subfunction)")
-        return
-
-    location_transformations_dict = venue_settings['locationTransformations']
-    overflow_locations_set = venue_settings['overflowLocations']
-
-    locations = storage_location.replace(",", "/").split("/")
-
-
-    for loc in locations:
-        loc = loc.split("(")[0].strip().upper()
-        # print(f"Processing location: {loc}")
-
-        # if the location is in overflow locations set, skip this location and move to the next
-        if loc in overflow_locations_set:
-            # print(f"[*] Skipping overflow location: {loc}")
-            continue
-
-        for transformation in location_transformations_dict:
-            original = transformation['original']
-            transformed = transformation['transformed']
-
-            if loc.startswith(original):
-                loc = transformed
-                print(f"[*] Transformed location: {loc}")
-                break
-
-
-        loc = renamed_locations.get(loc, loc)
-        normalized = normalize_location(loc)
-        # print(f"Normalized location: {normalized}") # debug
-
-        picking_area_id = picking_area_map.get(normalized)
+def get_best_picking_area(rules, storage_location, picking_area_index):
+    for normalized in rules.resolve(storage_location):
+        picking_area_id = picking_area_index.find(normalized)
         if picking_area_id:
             return picking_area_id
 
@@ -183,7 +187,7 @@ def fetch_all_items_information(venue_id):
         "Content-Type": "application/json",
     }
 
-    response = requests.get(url, headers=headers)
+    response = upstream_request("GET", url, venue_id=venue_id, headers=headers)
 
     if response.status_code == 200:
         return response.json()
@@ -191,138 +195,300 @@ def fetch_all_items_information(venue_id):
         print(f"Error fetching all items information: {response.status_code}, {response.text}")
         response.raise_for_status()
 
-def get_picking_areas(venue_id):
-    db = get_db()
-    picking_areas = db.picking_areas.find_one({"venue_id": venue_id})
-
-    if not picking_areas:
-        picking_areas = None
-    else:
-        if isinstance(picking_areas['last_updated'], str):
-            last_updated = datetime.fromisoformat(picking_areas['last_updated']).astimezone(pytz.utc)
+def process_and_attach_items(venue_id, force=False, progress=None, lease_lost=None):
+    # progress is an optional callback(stage, **counts) used by the reprocess jobs, lease_lost the
+    # event of the venue lease heartbeat, the run stops at its next stage or batch once it is set.
+    # every run is checkpointed in pipeline_runs, a run interrupted while attaching is resumed
+    # by the next one unless it is forced
+    venue_settings = get_db().venue_settings.find_one({"venue_id": venue_id}, {"rulesVersion": 1}) or {}
+    run, resumed = start_pipeline_run(venue_id, resume=not force, rules_version=venue_settings.get("rulesVersion", 0))
+    run_id = run["_id"]
+
+    def report(stage, **counts):
+        check_lease(venue_id, lease_lost)
+        checkpoint_pipeline_run(run_id, stage, counts)
+        if progress:
+            progress(stage, **counts)
+
+    try:
+        if resumed:
+            result = _resume_attach(venue_id, run, report, lease_lost)
         else:
-            if picking_areas['last_updated'].tzinfo is None:
-                last_updated = picking_areas['last_updated'].astimezone(pytz.utc)
-            else:
-                last_updated = picking_areas['last_updated']
+            result = _run_pipeline(venue_id, run_id, force, report, lease_lost)
+    except LeaseLost:
+        # left open, the worker holding the lease now resumes it
+        raise
+    except Exception as e:
+        finish_pipeline_run(run_id, "interrupted", error=str(e))
+        raise
 
-        current_time = datetime.now(pytz.utc)
-        expiration_time = current_time - timedelta(days=3)
+    finish_pipeline_run(run_id, result["status"], result=result)
+    return {**result, "runId": run_id}
 
-        if last_updated < expiration_time:
-            picking_areas = None
 
-    if not picking_areas:
-        venue_settings = db.venue_settings.find_one({"venue_id": venue_id})
-
-        if not venue_settings:
-            print(f"Venue settings not found for venue ID: {venue_id}")
-            return None
-
-        BASE_URL = venue_settings['endpoints']['BASE_URL']
-        VENUE_ID = venue_settings['endpoints']['VENUE_ID']
-        url = f"{BASE_URL}/v1/venues/{VENUE_ID}/picking-areas"
-        print(f"Fetching picking areas from {url}")
-        access_token = get_access_token()
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json",
-        }
-        response = requests.get(url, headers=headers)
-
-        if response.status_code == 200:
-            picking_areas = response.json()
-
-            for area in picking_areas["data"]:
-                area.pop("order", None)
-                area.pop("itemsCount", None)
-
-            tz = pytz.timezone('Asia/Jerusalem')
-            now = datetime.now(tz)
-            db.picking_areas.update_one(
-                {"venue_id": venue_id},
-                {"$set": {"picking_areas": picking_areas["data"], "last_updated": now}},
-                upsert=True
-            )
-
-            return picking_areas
-        else:
-            print(f"Error fetching picking areas: {response.status_code}, {response.text}")
-            return None
-    else:
-        return picking_areas
+def check_lease(venue_id, lease_lost):
+    if lease_lost is not None and lease_lost.is_set():
+        raise LeaseLost(f"Lease for venue {venue_id} was lost, stopping the run")
 
 
-def process_and_attach_items(venue_id):
+def _run_pipeline(venue_id, run_id, force, report, lease_lost):
     db = get_db()
     venue_settings = db.venue_settings.find_one({"venue_id": venue_id})
     if not venue_settings:
         print(f"Venue not found: {venue_id} in process_and_attach_items")
-        return
+        return {"status": "skipped", "reason": "Venue not found"}
 
-    db = get_db()
-
-    # first, get the picking areas
+    # first, get the picking areas, a stale copy is used while it refreshes in the background
+    report("picking_areas")
     picking_areas = get_picking_areas(venue_id)
 
     if not picking_areas:
         print(f"No picking areas found for venue: {venue_id} in process_and_attach_items")
-        return
+        return {"status": "skipped", "reason": "No picking areas"}
+
+    # a run is only skipped when the upstream payloads, the rules and the picking areas are all
+    # unchanged since the last completed run
+    inputs = inputs_key(venue_settings, picking_areas)
+    inputs_changed = get_validators(venue_id, "inputs").get("key") != inputs["key"]
+    # the validators of this run's fetches are committed once it completed
+    pending = {}
+
+    # get the item configs, a forced run always downloads the full payloads
+    report("item_configs")
+    item_configs = fetch_itemconfigs(venue_id, conditional=not force, pending=pending)
+    item_configs_changed = item_configs is not NOT_MODIFIED
+    if not item_configs_changed:
+        item_configs = load_snapshot("item_configs", venue_id)
+        if item_configs is None:
+            item_configs = fetch_itemconfigs(venue_id)
+            item_configs_changed = True
 
-    # get the item configs
-    item_configs = fetch_itemconfigs(venue_id)
     if not item_configs:
         print(f"No item configs found for venue: {venue_id} in process_and_attach_items")
-        return
+        return {"status": "skipped", "reason": "No item configs"}
 
-    db.item_configs.update_one(
-        {"venue_id": venue_id},
-        {
-            "$set": {
-                "item_configs": item_configs,
-                "last_updated": datetime.now(pytz.utc)
-            }
-        },
-        upsert=True
-    )
+    if item_configs_changed:
+        save_snapshot("item_configs", venue_id, item_configs, len(item_configs))
 
     # get the unassigned items
-    unassigned_items = fetch_unassigned_items(venue_id)
+    report("unassigned_items", itemConfigs=len(item_configs))
+    unassigned_items = fetch_unassigned_items(venue_id, conditional=not force, pending=pending)
+    unassigned_items_changed = unassigned_items is not NOT_MODIFIED
+    if not unassigned_items_changed:
+        if not item_configs_changed and not inputs_changed:
+            print(f"Upstream data unchanged for venue: {venue_id}, skipping run")
+            return {"status": "skipped", "reason": "Upstream data unchanged"}
+        unassigned_items = load_snapshot("unassigned_items", venue_id)
+        if unassigned_items is None:
+            unassigned_items = fetch_unassigned_items(venue_id)
+            unassigned_items_changed = True
+
     if not unassigned_items:
         print(f"No unassigned items found for venue: {venue_id} in process_and_attach_items")
-        return
+        # nothing left to assign is a complete result, the next run may skip until something changes
+        commit_validators(venue_id, {**pending, "inputs": inputs})
+        return {"status": "skipped", "reason": "No unassigned items"}
 
-    db.unassigned_items.update_one(
-        {"venue_id": venue_id},
-        {
-            "$set": {
-                "unassigned_items": unassigned_items,
-                "last_updated": datetime.now(pytz.utc)
-            }
-        },
-        upsert=True
-    )
+    if unassigned_items_changed:
+        save_snapshot("unassigned_items", venue_id, unassigned_items, len(unassigned_items['data']))
 
-    assigned_items, unavailable_items = process_unassigned_items(venue_id, unassigned_items, item_configs, picking_areas['picking_areas'])
+    checkpoint_pipeline_run(run_id, snapshots={
+        collection: (get_snapshot_info(collection, venue_id) or {}).get("content_hash")
+        for collection in ["item_configs", "unassigned_items"]
+    })
+    report("matching", itemConfigs=len(item_configs), unassignedItems=len(unassigned_items['data']))
+    assigned_items, unavailable_items, unallocated_items = process_unassigned_items(venue_id, unassigned_items, item_configs, picking_areas['picking_areas'])
 
     # load all items information
+    report("all_items", assigned=len(assigned_items), unavailable=len(unavailable_items))
     all_items_information = fetch_all_items_information(venue_id)
     if not all_items_information:
         print(f"No all items information found for venue: {venue_id} in process_and_attach_items")
-        return
+        return {"status": "skipped", "reason": "No all items information"}
 
     # create a specific volume (file) in which we will store all items information
     with open(f"{venue_id}.json", 'w') as file:
         json.dump(all_items_information, file)
 
-    attach_items_to_picking_routes(venue_id, assigned_items)
+    # every item still in the unassigned feed is attached, only area changes are journaled
+    changed_items, previous_assignments = compute_assignment_delta(venue_id, assigned_items)
+    save_assignment_set(run_id, assigned_items)
+    report("attaching", assigned=len(assigned_items), unavailable=len(unavailable_items), changed=len(changed_items))
+    attached_items = _attach_with_checkpoints(
+        venue_id, run_id, assigned_items, previous_assignments, index_catalog(all_items_information), lease_lost
+    )
+    # the overview, history and venue list responses of this venue are rebuilt on their next read
+    bump_generation(venue_id)
+    if not Config.ATTACH_ITEMS or len(attached_items) == len(assigned_items):
+        commit_validators(venue_id, {**pending, "inputs": inputs})
+    else:
+        # rejected items are retried by the next run instead of being skipped as unchanged
+        print(f"{len(assigned_items) - len(attached_items)} items were not attached for venue: {venue_id}, keeping the validators")
+
+    return {
+        "status": "completed",
+        "itemConfigs": len(item_configs),
+        "unassignedItems": len(unassigned_items['data']),
+        "assigned": len(assigned_items),
+        "unavailable": len(unavailable_items),
+        "unallocated": len(unallocated_items),
+        "changed": len(changed_items),
+        "attached": len(attached_items),
+        "dryRun": not Config.ATTACH_ITEMS,
+    }
+
+
+def inputs_key(venue_settings, picking_areas):
+    # identifies the rules and picking areas a run matched against, stored next to the fetch validators.
+    # dry runs record nothing, so enabling ATTACH_ITEMS has to rerun the venue as well
+    areas = json.dumps(picking_areas['picking_areas'], sort_keys=True, default=str)
+    rules_version = venue_settings.get('rulesVersion', 0)
+    mode = "attach" if Config.ATTACH_ITEMS else "dry_run"
+    return {
+        "key": f"{rules_version}:{mode}:{hashlib.sha256(areas.encode()).hexdigest()}",
+        "rules_version": rules_version,
+    }
+
+
+def _attach_with_checkpoints(venue_id, run_id, items, previous_assignments, catalog, lease_lost=None):
+    def on_batch(picking_area_id, batch):
+        # journaled per batch, so a resumed run finds these items already assigned and skips them
+        record_assignments(venue_id, batch, previous_assignments, catalog)
+        record_pipeline_batch(run_id, f"{picking_area_id}:{batch[0]['itemId']}", len(batch))
+
+    return attach_items_to_picking_routes(venue_id, items, on_batch=on_batch, lease_lost=lease_lost)
+
+
+def _resume_attach(venue_id, run, report, lease_lost):
+    items = load_assignment_set(run)
+    _, previous_assignments = compute_assignment_delta(venue_id, items)
+    # items upserted since the run started were attached before it was interrupted
+    attached_ids = {
+        item_id for item_id, assignment in previous_assignments.items()
+        if assignment.get("updated_at") and assignment["updated_at"] >= run["started_at"]
+    }
+    remaining_items = [item for item in items if item["itemId"] not in attached_ids]
+    print(f"Resuming run {run['_id']} for venue {venue_id}: {len(remaining_items)} of {len(items)} items left to attach")
+    report("attaching", assigned=len(items), remaining=len(remaining_items))
+
+    catalog = index_catalog(fetch_all_items_information(venue_id) or []) if remaining_items else {}
+    attached_items = _attach_with_checkpoints(
+        venue_id, run["_id"], remaining_items, previous_assignments, catalog, lease_lost
+    )
+    bump_generation(venue_id)
+
+    return {
+        "status": "completed",
+        "resumed": True,
+        "assigned": len(items),
+        "attached": run.get("attached", 0) + len(attached_items),
+        "dryRun": not Config.ATTACH_ITEMS,
+    }
+
+
+def _ensure_assignment_indexes(db):
+    global _assignment_indexes_ready
+    if _assignment_indexes_ready:
+        return
+    db.item_assignments.create_index([("venue_id", 1), ("item_id", 1)], unique=True)
+    db.item_updates.create_index([("venue", 1), ("timestamp", -1)])
+    _assignment_indexes_ready = True
+
 
-def attach_items_to_picking_routes(venue_id, assigned_items):
+def compute_assignment_delta(venue_id, assigned_items):
+    db = get_db()
+    _ensure_assignment_indexes(db)
+
+    item_ids = [item["itemId"] for item in assigned_items]
+    previous_assignments = {
+        assignment["item_id"]: assignment
+        for assignment in db.item_assignments.find(
+            {"venue_id": venue_id, "item_id": {"$in": item_ids}},
+            {"_id": 0, "item_id": 1, "picking_area_id": 1, "picking_area_name": 1, "updated_at": 1}
+        )
+    }
+
+    return select_changed_items(assigned_items, previous_assignments), previous_assignments
+
+
+def select_changed_items(assigned_items, previous_assignments):
+    return [
+        item for item in assigned_items
+        if previous_assignments.get(item["itemId"], {}).get("picking_area_id") != item["pickingAreaId"]
+    ]
+
+
+def index_catalog(all_items_information):
+    # the all items endpoint returns either a list or a {"data": [...]} envelope
+    items = all_items_information.get("data", []) if isinstance(all_items_information, dict) else all_items_information
+    return {item.get("id"): item for item in items if isinstance(item, dict)}
+
+
+def _catalog_value(item, *keys, default=None):
+    for key in keys:
+        if item.get(key):
+            return item[key]
+    return default
+
+
+def record_assignments(venue_id, attached_items, previous_assignments, catalog):
+    if not attached_items:
+        return
+
+    db = get_db()
+    journal, operations = build_assignment_records(venue_id, attached_items, previous_assignments, catalog)
+    if journal:
+        db.item_updates.insert_many(journal, ordered=False)
+    db.item_assignments.bulk_write(operations, ordered=False)
+    print(f"Journaled {len(journal)} assignment changes for venue: {venue_id}")
+
+
+def build_assignment_records(venue_id, attached_items, previous_assignments, catalog):
+    # returns (item_updates journal entries, item_assignments upserts), every item is upserted but only
+    # the ones whose picking area changed since the last recorded assignment are journaled
+    now = datetime.now(pytz.utc)
+    journal = []
+    operations = []
+
+    for item in attached_items:
+        item_id = item["itemId"]
+        product = catalog.get(item_id, {})
+        previous = previous_assignments.get(item_id)
+        operations.append(UpdateOne(
+            {"venue_id": venue_id, "item_id": item_id},
+            {"$set": {
+                "picking_area_id": item["pickingAreaId"],
+                "picking_area_name": item["pickingAreaName"],
+                "updated_at": now
+            }},
+            upsert=True
+        ))
+        if previous and previous.get("picking_area_id") == item["pickingAreaId"]:
+            continue
+
+        journal.append({
+            "venue": venue_id,
+            "item_id": item_id,
+            "product_name": _catalog_value(product, "name", "title", default="Unknown"),
+            "image_url": _catalog_value(product, "imageUrl", "image_url", "image", default="default-image.jpg"),
+            "gtin": _catalog_value(product, "gtin", "barcode", default="N/A"),
+            "previous_picking_area": previous["picking_area_name"] if previous else "Unassigned Items",
+            "picking_area_name": item["pickingAreaName"],
+            "timestamp": now
+        })
+
+    return journal, operations
+
+
+def attach_items_to_picking_routes(venue_id, assigned_items, on_batch=None, lease_lost=None):
+    # one request per picking area and batch, returns the items the upstream accepted (none in a dry run).
+    # on_batch(picking_area_id, items) is called with the accepted items of every batch, LeaseLost is
+    # raised before the next batch once lease_lost is set
     db = get_db()
     venue_settings = db.venue_settings.find_one({"venue_id": venue_id})
     if not venue_settings:
         print(f"Venue not found: {venue_id}")
-        return
+        return []
 
     BASE_URL = venue_settings['endpoints']['BASE_URL']
     VENUE_ID = venue_settings['endpoints']['VENUE_ID']
@@ -330,16 +496,67 @@ def attach_items_to_picking_routes(venue_id, assigned_items):
 
     print("Total items to assign:", len(assigned_items))
 
+    items_by_area = {}
     for item in assigned_items:
-        picking_area_id = item["pickingAreaId"]
+        items_by_area.setdefault(item["pickingAreaId"], []).append(item)
+
+    attached_items = []
+    for picking_area_id, items in items_by_area.items():
         url = f"{BASE_URL}/v1/venues/{VENUE_ID}/picking-areas/{picking_area_id}/items"
-        payload = {"data": [item["itemId"]]}
-        print(f"Assigning item {item['itemId']} to picking area {picking_area_id}")
-        # response = requests.post(url, headers=headers, json=payload)
-        # if response.status_code in [200, 207]:
-        #     print(f"Assigned item {item['itemId']} to picking area {picking_area_id}")
-        # else:
-        #     print(f"Failed to assign item {item['itemId']}: {response.text}")
+        for start in range(0, len(items), Config.ATTACH_BATCH_SIZE):
+            batch = items[start:start + Config.ATTACH_BATCH_SIZE]
+            check_lease(venue_id, lease_lost)
+
+            if not Config.ATTACH_ITEMS:
+                # dry run, nothing is journaled or recorded as assigned so the items are still
+                # attached once ATTACH_ITEMS is enabled
+                print(f"Dry run, would assign {len(batch)} items to picking area {picking_area_id}")
+                continue
+
+            print(f"Assigning {len(batch)} items to picking area {picking_area_id}")
+            payload = {"data": [item["itemId"] for item in batch]}
+            response = upstream_request("POST", url, venue_id=venue_id, headers=headers, json=payload)
+            accepted = accepted_items(response, batch)
+            if len(accepted) < len(batch):
+                print(f"Failed to assign {len(batch) - len(accepted)} of {len(batch)} items to picking area {picking_area_id}: {response.text}")
+            if not accepted:
+                continue
+
+            attached_items.extend(accepted)
+            if on_batch:
+                on_batch(picking_area_id, accepted)
+
+    return attached_items
+
+
+def accepted_items(response, batch):
+    # the items of a batch the upstream accepted. A 207 reports every item on its own, either as
+    # {"data": [{"id", "status"}]} results or as a list of failed ids, anything else counts as rejected
+    if response.status_code == 200:
+        return batch
+    if response.status_code != 207:
+        return []
+
+    try:
+        body = response.json()
+    except ValueError:
+        print(f"Unreadable multi-status response: {response.text}")
+        return []
+    if not isinstance(body, dict):
+        return []
+
+    if isinstance(body.get("failed"), list):
+        failed = {str(item_id) for item_id in body["failed"]}
+        return [item for item in batch if str(item["itemId"]) not in failed]
+
+    accepted = set()
+    for result in body.get("data") or []:
+        if not isinstance(result, dict):
+            continue
+        status = result.get("status")
+        if result.get("success") is True or (isinstance(status, int) and 200 <= status < 300):
+            accepted.add(str(result.get("id", result.get("itemId"))))
+    return [item for item in batch if str(item["itemId"]) in accepted]
 
 
 def reprocess_items(venue_id):
@@ -348,6 +565,6 @@ def reprocess_items(venue_id):
     if not venue_settings:
         return {"error": "Venue not found"}
 
-    process_and_attach_items(venue_id)
+    result = process_and_attach_items(venue_id, force=True)
 
-    return {"message": "Items reprocessed successfully"}
\ No newline at end of file
+    return {"message": "Items reprocessed successfully", "result": result}
\ No newline at end of file
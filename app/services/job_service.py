@@ -0,0 +1,128 @@
+import uuid
+
+from app.config import Config
+from app.services.database import get_db
+from app.services.item_service import process_and_attach_items
+from app.services.queue_service import new_worker_id, run_with_lease
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+import pytz
+
+_executor = ThreadPoolExecutor(max_workers=Config.REPROCESS_WORKERS, thread_name_prefix="reprocess")
+_indexes_ready = False
+
+
+def _ensure_indexes(db):
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    # at most one active job per venue, across every process sharing the database
+    db.reprocess_jobs.create_index(
+        "venue_id",
+        name="active_job_per_venue",
+        unique=True,
+        partialFilterExpression={"active": True}
+    )
+    db.reprocess_jobs.create_index([("venue_id", 1), ("created_at", -1)])
+    _indexes_ready = True
+
+
+def _expire_stale_job(db, venue_id):
+    # a job whose worker died keeps its active flag, release it once it stops reporting progress
+    cutoff = datetime.now(pytz.utc) - timedelta(seconds=Config.REPROCESS_JOB_STALE_AFTER)
+    db.reprocess_jobs.update_one(
+        {"venue_id": venue_id, "active": True, "updated_at": {"$lt": cutoff}},
+        {"$set": {"status": "failed", "error": "Job stopped reporting progress"}, "$unset": {"active": ""}}
+    )
+
+
+def submit_reprocess_job(venue_id, requested_by=None):
+    # returns (job, created), concurrent submissions for the same venue share the active job
+    db = get_db()
+    _ensure_indexes(db)
+    _expire_stale_job(db, venue_id)
+
+    now = datetime.now(pytz.utc)
+    job = {
+        "_id": uuid.uuid4().hex,
+        "venue_id": venue_id,
+        "requested_by": requested_by,
+        "status": "queued",
+        "stage": None,
+        "progress": {},
+        "result": None,
+        "error": None,
+        "active": True,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+    try:
+        db.reprocess_jobs.insert_one(job)
+    except DuplicateKeyError:
+        existing = db.reprocess_jobs.find_one({"venue_id": venue_id, "active": True})
+        if existing:
+            return existing, False
+        # the active job finished between the insert and the lookup
+        return submit_reprocess_job(venue_id, requested_by)
+
+    _executor.submit(_run_job, job["_id"], venue_id)
+    return job, True
+
+
+def _update_job(job_id, fields, unset=None):
+    db = get_db()
+    update = {"$set": {**fields, "updated_at": datetime.now(pytz.utc)}}
+    if unset:
+        update["$unset"] = {field: "" for field in unset}
+    db.reprocess_jobs.update_one({"_id": job_id}, update)
+
+
+def _run_job(job_id, venue_id):
+    _update_job(job_id, {"status": "running", "started_at": datetime.now(pytz.utc)})
+
+    def progress(stage, **counts):
+        _update_job(job_id, {"stage": stage, "progress": counts})
+
+    try:
+        # the venue lease keeps a manual run from overlapping a scheduled one on any worker
+        acquired, result = run_with_lease(
+            venue_id,
+            new_worker_id(),
+            lambda lost: process_and_attach_items(venue_id, force=True, progress=progress, lease_lost=lost),
+            job_id=job_id
+        )
+        if not acquired:
+            raise RuntimeError("Another run is in progress for this venue")
+    except Exception as e:
+        print(f"Reprocess job {job_id} failed for venue {venue_id}: {e}")
+        _update_job(job_id, {"status": "failed", "error": str(e), "finished_at": datetime.now(pytz.utc)}, unset=["active"])
+        return
+
+    _update_job(job_id, {
+        "status": "completed",
+        "stage": "done",
+        "result": result,
+        "finished_at": datetime.now(pytz.utc)
+    }, unset=["active"])
+
+
+def get_job(job_id):
+    db = get_db()
+    return db.reprocess_jobs.find_one({"_id": job_id})
+
+
+def serialize_job(job):
+    return {
+        "jobId": job["_id"],
+        "venue": job["venue_id"],
+        "status": job["status"],
+        "stage": job.get("stage"),
+        "progress": job.get("progress", {}),
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "createdAt": job.get("created_at"),
+        "startedAt": job.get("started_at"),
+        "finishedAt": job.get("finished_at"),
+    }
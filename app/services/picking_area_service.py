@@ -0,0 +1,171 @@
+import threading
+
+from app.config import Config
+from app.services.cache_service import get_generation
+from app.services.database import get_db
+from app.services.token_service import get_access_token
+from app.services.upstream_service import clear_validators, conditional_get
+from datetime import datetime, timedelta
+import pytz
+
+# in-process copy of the picking_areas documents, the mongo collection is the shared tier.
+# venue_id -> (cache generation, document), a bumped generation makes the next read go back to mongo
+_cache = {}
+_refreshing = set()
+_lock = threading.Lock()
+
+
+def normalize_timestamp(value):
+    # last_updated was historically written as iso strings, naive and aware datetimes
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        # pymongo returns naive datetimes in utc
+        return value.replace(tzinfo=pytz.utc)
+    return value.astimezone(pytz.utc)
+
+
+def is_stale(picking_areas):
+    last_updated = normalize_timestamp(picking_areas.get('last_updated'))
+    if last_updated is None:
+        return True
+    return last_updated < datetime.now(pytz.utc) - timedelta(seconds=Config.PICKING_AREAS_TTL)
+
+
+def next_refresh_time(picking_areas):
+    last_updated = normalize_timestamp(picking_areas.get('last_updated'))
+    if last_updated is None:
+        return None
+    return last_updated + timedelta(seconds=Config.PICKING_AREAS_TTL)
+
+
+def _load_from_db(venue_id):
+    db = get_db()
+    picking_areas = db.picking_areas.find_one({"venue_id": venue_id}, {'_id': 0})
+    if picking_areas:
+        picking_areas['last_updated'] = normalize_timestamp(picking_areas.get('last_updated'))
+    return picking_areas
+
+
+def _remember(venue_id, picking_areas):
+    _cache[venue_id] = (get_generation(venue_id), picking_areas)
+
+
+def load_stored_picking_areas(venue_id):
+    # the stored copy only, no upstream call and no refresh, for the warm-up of serving processes
+    picking_areas = _load_from_db(venue_id)
+    if picking_areas:
+        _remember(venue_id, picking_areas)
+    return picking_areas
+
+
+def get_picking_areas(venue_id, force_refresh=False):
+    # stale copies are served while a background refresh runs, the upstream is only called inline
+    # when a refresh is forced or no copy exists at all
+    if force_refresh:
+        return refresh_picking_areas(venue_id, force=True)
+
+    generation = get_generation(venue_id)
+    cached = _cache.get(venue_id)
+    picking_areas = cached[1] if cached and cached[0] == generation else None
+    if picking_areas is None or is_stale(picking_areas):
+        # another process may already have refreshed or invalidated the shared copy
+        stored = _load_from_db(venue_id)
+        if stored:
+            picking_areas = stored
+            _cache[venue_id] = (generation, stored)
+
+    if picking_areas is None:
+        # a new venue or an invalidated copy, there is nothing to serve in the meantime
+        print(f"No cached picking areas for venue: {venue_id}, fetching them")
+        return refresh_picking_areas(venue_id)
+
+    if is_stale(picking_areas):
+        schedule_refresh(venue_id)
+
+    return picking_areas
+
+
+def schedule_refresh(venue_id):
+    with _lock:
+        if venue_id in _refreshing:
+            return False
+        _refreshing.add(venue_id)
+
+    def run():
+        try:
+            refresh_picking_areas(venue_id)
+        except Exception as e:
+            print(f"Background picking areas refresh failed for venue {venue_id}: {e}")
+        finally:
+            with _lock:
+                _refreshing.discard(venue_id)
+
+    threading.Thread(target=run, daemon=True).start()
+    return True
+
+
+def refresh_picking_areas(venue_id, force=False):
+    db = get_db()
+    venue_settings = db.venue_settings.find_one({"venue_id": venue_id})
+
+    if not venue_settings:
+        print(f"Venue settings not found for venue ID: {venue_id}")
+        return None
+
+    stored = _load_from_db(venue_id)
+
+    BASE_URL = venue_settings['endpoints']['BASE_URL']
+    VENUE_ID = venue_settings['endpoints']['VENUE_ID']
+    url = f"{BASE_URL}/v1/venues/{VENUE_ID}/picking-areas"
+    print(f"Fetching picking areas from {url}")
+    access_token = get_access_token()
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json",
+    }
+
+    # validators are only meaningful while we still hold the copy they describe
+    if force or not stored:
+        clear_validators(venue_id, "picking_areas")
+    response, changed = conditional_get(venue_id, "picking_areas", url, headers)
+
+    now = datetime.now(pytz.utc)
+
+    if stored and not changed and response.status_code in [200, 304]:
+        print(f"Picking areas unchanged for venue: {venue_id}")
+        db.picking_areas.update_one({"venue_id": venue_id}, {"$set": {"last_updated": now}})
+        stored['last_updated'] = now
+        _remember(venue_id, stored)
+        return stored
+
+    if response.status_code != 200:
+        # keep serving the stale copy, the next read schedules another attempt
+        print(f"Error fetching picking areas: {response.status_code}, {response.text}")
+        return None
+
+    data = response.json()["data"]
+    for area in data:
+        area.pop("order", None)
+        area.pop("itemsCount", None)
+
+    db.picking_areas.update_one(
+        {"venue_id": venue_id},
+        {"$set": {"picking_areas": data, "last_updated": now}},
+        upsert=True
+    )
+
+    picking_areas = {"venue_id": venue_id, "picking_areas": data, "last_updated": now}
+    _remember(venue_id, picking_areas)
+    return picking_areas
+
+
+def invalidate_picking_areas(venue_id):
+    # drops every copy of the venue's picking areas, for endpoint changes and deleted venues. The other
+    # processes notice through the generation bump that follows every venue write
+    db = get_db()
+    db.picking_areas.delete_one({"venue_id": venue_id})
+    clear_validators(venue_id, "picking_areas")
+    _cache.pop(venue_id, None)
@@ -0,0 +1,124 @@
+import uuid
+
+from app.config import Config
+from app.services.database import get_db
+from datetime import datetime, timedelta
+from pymongo import DESCENDING
+from pymongo.errors import OperationFailure
+import pytz
+
+# runs left in one of these states were interrupted, only the attach stage can be resumed
+OPEN_STATUSES = ["running", "interrupted"]
+
+
+class LeaseLost(Exception):
+    # raised when the venue lease expired under a running run, the run is left open so the worker
+    # that took over the lease resumes it
+    pass
+
+_indexes_ready = False
+
+
+def _ensure_indexes(db):
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    db.pipeline_runs.create_index([("venue_id", 1), ("status", 1), ("started_at", -1)])
+    if Config.PIPELINE_RUNS_RETENTION_DAYS:
+        # finished runs expire, open ones have no finished_at and stay until resumed or abandoned
+        expire_after = Config.PIPELINE_RUNS_RETENTION_DAYS * 24 * 60 * 60
+        try:
+            db.pipeline_runs.create_index("finished_at", name="finished_ttl", expireAfterSeconds=expire_after)
+        except OperationFailure:
+            # the retention changed since the index was created
+            db.command("collMod", "pipeline_runs", index={"name": "finished_ttl", "expireAfterSeconds": expire_after})
+    _indexes_ready = True
+
+
+def start_pipeline_run(venue_id, resume=True, rules_version=0):
+    # returns (run, resumed), the caller holds the venue lease so an open run here is an interrupted one.
+    # a run is only resumed under the rules it matched with, any other open run is abandoned
+    db = get_db()
+    _ensure_indexes(db)
+    now = datetime.now(pytz.utc)
+
+    if resume:
+        run = db.pipeline_runs.find_one_and_update(
+            {
+                "venue_id": venue_id,
+                "status": {"$in": OPEN_STATUSES},
+                "stage": "attaching",
+                "rules_version": rules_version,
+                "updated_at": {"$gte": now - timedelta(seconds=Config.PIPELINE_RESUME_WINDOW)},
+            },
+            {"$set": {"status": "running", "updated_at": now}, "$inc": {"resumes": 1}},
+            sort=[("started_at", DESCENDING)],
+        )
+        if run:
+            return run, True
+
+    db.pipeline_runs.update_many(
+        {"venue_id": venue_id, "status": {"$in": OPEN_STATUSES}},
+        {"$set": {"status": "abandoned", "updated_at": now, "finished_at": now}, "$unset": {"assignments": ""}}
+    )
+
+    run = {
+        "_id": uuid.uuid4().hex,
+        "venue_id": venue_id,
+        "rules_version": rules_version,
+        "status": "running",
+        "stage": None,
+        "progress": {},
+        "snapshots": {},
+        "batches": [],
+        "attached": 0,
+        "resumes": 0,
+        "started_at": now,
+        "updated_at": now,
+    }
+    db.pipeline_runs.insert_one(run)
+    return run, False
+
+
+def checkpoint_pipeline_run(run_id, stage=None, progress=None, **fields):
+    update = {**fields, "updated_at": datetime.now(pytz.utc)}
+    if stage:
+        update["stage"] = stage
+    if progress is not None:
+        update["progress"] = progress
+    get_db().pipeline_runs.update_one({"_id": run_id}, {"$set": update})
+
+
+def save_assignment_set(run_id, items):
+    # compact [item, area] pairs plus the area names, enough to resume the attach stage
+    area_names = {}
+    assignments = []
+    for item in items:
+        area_names[item["pickingAreaId"]] = item["pickingAreaName"]
+        assignments.append([item["itemId"], item["pickingAreaId"]])
+    checkpoint_pipeline_run(run_id, assignments=assignments, area_names=area_names)
+
+
+def load_assignment_set(run):
+    area_names = run.get("area_names", {})
+    return [
+        {"itemId": item_id, "pickingAreaId": area_id, "pickingAreaName": area_names.get(area_id, "Unknown")}
+        for item_id, area_id in run.get("assignments", [])
+    ]
+
+
+def record_pipeline_batch(run_id, batch_key, count):
+    get_db().pipeline_runs.update_one(
+        {"_id": run_id},
+        {"$addToSet": {"batches": batch_key}, "$inc": {"attached": count}, "$set": {"updated_at": datetime.now(pytz.utc)}}
+    )
+
+
+def finish_pipeline_run(run_id, status, result=None, error=None):
+    now = datetime.now(pytz.utc)
+    update = {"$set": {"status": status, "result": result, "error": error, "updated_at": now}}
+    if status not in OPEN_STATUSES:
+        # the assignment set is only kept while the run can still be resumed
+        update["$set"]["finished_at"] = now
+        update["$unset"] = {"assignments": ""}
+    get_db().pipeline_runs.update_one({"_id": run_id}, update)
@@ -0,0 +1,66 @@
+import atexit
+import threading
+import time
+
+from app.config import Config
+from app.services.database import get_db
+from datetime import datetime
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+# username -> fields to $set on the next flush, later calls overwrite earlier ones
+_pending = {}
+_lock = threading.Lock()
+_flusher = None
+
+
+def record_presence(username, ip_address, first_login=False):
+    fields = {'last_seen': datetime.utcnow(), 'ip_address': ip_address}
+    if first_login:
+        fields['firstLogin'] = True
+
+    with _lock:
+        _pending.setdefault(username, {}).update(fields)
+
+    _ensure_flusher()
+
+
+def flush_presence():
+    global _pending
+    with _lock:
+        batch, _pending = _pending, {}
+
+    if not batch:
+        return 0
+
+    operations = [UpdateOne({'username': username}, {'$set': fields}) for username, fields in batch.items()]
+    try:
+        get_db().users.bulk_write(operations, ordered=False)
+    except PyMongoError as e:
+        print(f"Failed to flush presence updates for {len(operations)} users: {e}")
+        # put the batch back without overwriting anything newer recorded in the meantime
+        with _lock:
+            for username, fields in batch.items():
+                _pending[username] = {**fields, **_pending.get(username, {})}
+        return 0
+
+    return len(operations)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(Config.PRESENCE_FLUSH_INTERVAL)
+        flush_presence()
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None and _flusher.is_alive():
+        return
+    with _lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_flush_loop, name="presence-flusher", daemon=True)
+            _flusher.start()
+
+
+atexit.register(flush_presence)
@@ -0,0 +1,234 @@
+import os
+import socket
+import threading
+import time
+import uuid
+
+from app.config import Config
+from app.services.database import get_db
+from app.services.item_service import process_and_attach_items
+from app.services.pipeline_service import LeaseLost
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import pytz
+
+_indexes_ready = False
+
+
+def _now():
+    return datetime.now(pytz.utc)
+
+
+def new_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _ensure_indexes(db):
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    # a venue has at most one pending run, repeated scheduler ticks collapse into it
+    db.venue_run_queue.create_index(
+        "venue_id",
+        name="pending_run_per_venue",
+        unique=True,
+        partialFilterExpression={"status": "pending"}
+    )
+    db.venue_run_queue.create_index([("status", 1), ("enqueued_at", 1)])
+    _indexes_ready = True
+
+
+def enqueue_venue_run(venue_id, force=False, source="scheduler"):
+    db = get_db()
+    _ensure_indexes(db)
+    try:
+        db.venue_run_queue.update_one(
+            {"venue_id": venue_id, "status": "pending"},
+            {
+                "$setOnInsert": {"enqueued_at": _now(), "attempts": 0, "source": source},
+                "$max": {"force": force}
+            },
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # another scheduler tick inserted the pending run at the same moment
+        pass
+
+
+def acquire_lease(venue_id, owner, job_id=None):
+    # the lease document _id is the venue id, so only one owner can hold it until it expires
+    db = get_db()
+    now = _now()
+    try:
+        db.venue_leases.find_one_and_update(
+            {"_id": venue_id, "$or": [{"expires_at": {"$lt": now}}, {"owner": owner}]},
+            {"$set": {
+                "owner": owner,
+                "job_id": job_id,
+                "acquired_at": now,
+                "expires_at": now + timedelta(seconds=Config.VENUE_LEASE_TTL)
+            }},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+def renew_lease(venue_id, owner):
+    db = get_db()
+    expires_at = _now() + timedelta(seconds=Config.VENUE_LEASE_TTL)
+    result = db.venue_leases.update_one({"_id": venue_id, "owner": owner}, {"$set": {"expires_at": expires_at}})
+    if result.matched_count == 0:
+        return False
+    db.venue_run_queue.update_one(
+        {"venue_id": venue_id, "status": "running", "worker": owner},
+        {"$set": {"lease_expires_at": expires_at}}
+    )
+    return True
+
+
+def release_lease(venue_id, owner):
+    db = get_db()
+    db.venue_leases.delete_one({"_id": venue_id, "owner": owner})
+
+
+def start_heartbeat(venue_id, owner):
+    # returns (stop, lost). lost is set when the lease could not be renewed, another worker may hold
+    # it by then and the run has to stop before its next batch
+    stop = threading.Event()
+    lost = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(Config.VENUE_LEASE_TTL / 3):
+            try:
+                renewed = renew_lease(venue_id, owner)
+            except Exception as e:
+                print(f"Failed to renew the lease for venue {venue_id}: {e}")
+                continue
+            if not renewed:
+                print(f"Lost lease for venue {venue_id} held by {owner}")
+                lost.set()
+                return
+
+    threading.Thread(target=heartbeat, name=f"lease-{venue_id}", daemon=True).start()
+    return stop, lost
+
+
+def run_with_lease(venue_id, owner, run, job_id=None):
+    # returns (acquired, result). The lease is renewed in the background for as long as run(lost) takes,
+    # run receives the lost event of start_heartbeat
+    if not acquire_lease(venue_id, owner, job_id):
+        return False, None
+
+    stop, lost = start_heartbeat(venue_id, owner)
+    try:
+        return True, run(lost)
+    finally:
+        stop.set()
+        release_lease(venue_id, owner)
+
+
+def run_venue_now(venue_id, force=False):
+    # local execution for the scheduler, skipped when the venue is already running elsewhere
+    acquired, result = run_with_lease(
+        venue_id, new_worker_id(), lambda lost: process_and_attach_items(venue_id, force=force, lease_lost=lost)
+    )
+    if not acquired:
+        print(f"Venue {venue_id} is already running on another worker, skipping")
+    return result
+
+
+def requeue_abandoned_runs():
+    # runs whose worker stopped renewing the lease go back to pending, or fail after too many attempts
+    db = get_db()
+    now = _now()
+    for job in db.venue_run_queue.find({"status": "running", "lease_expires_at": {"$lt": now}}):
+        status = "failed" if job.get("attempts", 0) >= Config.WORKER_MAX_ATTEMPTS else "pending"
+        try:
+            db.venue_run_queue.update_one(
+                {"_id": job["_id"], "status": "running"},
+                {"$set": {"status": status, "error": f"Lease of {job.get('worker')} expired"}}
+            )
+        except DuplicateKeyError:
+            # a newer pending run for the venue already exists
+            db.venue_run_queue.update_one(
+                {"_id": job["_id"], "status": "running"},
+                {"$set": {"status": "failed", "error": f"Lease of {job.get('worker')} expired"}}
+            )
+
+
+def claim_next_run(owner):
+    db = get_db()
+    _ensure_indexes(db)
+
+    for job in db.venue_run_queue.find({"status": "pending"}).sort("enqueued_at", 1).limit(50):
+        if not acquire_lease(job["venue_id"], owner, job["_id"]):
+            continue
+
+        claimed = db.venue_run_queue.find_one_and_update(
+            {"_id": job["_id"], "status": "pending"},
+            {
+                "$set": {
+                    "status": "running",
+                    "worker": owner,
+                    "started_at": _now(),
+                    "lease_expires_at": _now() + timedelta(seconds=Config.VENUE_LEASE_TTL)
+                },
+                "$inc": {"attempts": 1}
+            },
+            return_document=ReturnDocument.AFTER
+        )
+        if claimed:
+            return claimed
+        release_lease(job["venue_id"], owner)
+
+    return None
+
+
+def _execute_run(job, owner):
+    db = get_db()
+    venue_id = job["venue_id"]
+    stop, lost = start_heartbeat(venue_id, owner)
+    try:
+        result = process_and_attach_items(venue_id, force=job.get("force", False), lease_lost=lost)
+        db.venue_run_queue.update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": "done", "result": result, "finished_at": _now()}}
+        )
+    except LeaseLost as e:
+        # requeue_abandoned_runs hands the job to another worker, which resumes the run
+        print(f"Run for venue {venue_id} aborted on {owner}: {e}")
+    except Exception as e:
+        print(f"Run for venue {venue_id} failed on {owner}: {e}")
+        db.venue_run_queue.update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": "failed", "error": str(e), "finished_at": _now()}}
+        )
+    finally:
+        stop.set()
+        release_lease(venue_id, owner)
+
+
+def run_worker(owner=None, stop_event=None):
+    owner = owner or new_worker_id()
+    print(f"Worker {owner} started")
+
+    while not (stop_event and stop_event.is_set()):
+        try:
+            requeue_abandoned_runs()
+            job = claim_next_run(owner)
+            if job:
+                print(f"Worker {owner} running venue {job['venue_id']}")
+                _execute_run(job, owner)
+                continue
+        except Exception as e:
+            # mongo being unreachable for a moment must not end the worker thread
+            print(f"Worker {owner} failed to poll the queue: {e}")
+        if stop_event:
+            stop_event.wait(Config.WORKER_POLL_INTERVAL)
+        else:
+            time.sleep(Config.WORKER_POLL_INTERVAL)
+    print(f"Worker {owner} stopped")
@@ -0,0 +1,147 @@
+import gzip
+import os
+
+from app.config import Config
+from app.services.database import get_db
+from bson import json_util
+from datetime import datetime, timedelta
+from pymongo.errors import OperationFailure
+import pytz
+from urllib.parse import quote
+
+# collection -> (retention in days, field partitioning the archive by venue), 0 days keeps everything
+RETENTION_POLICIES = {
+    "item_updates": (Config.ITEM_UPDATES_RETENTION_DAYS, "venue"),
+    "history": (Config.HISTORY_RETENTION_DAYS, None),
+}
+TTL_INDEX_NAME = "retention_ttl"
+# archives of collections without a venue field go to this partition
+SHARED_PARTITION = "_all"
+
+
+def _archive_path(collection, venue, month):
+    # the venue id is percent-encoded into a single directory name, plain ids keep their name
+    partition = quote(str(venue), safe="")
+    if not partition.strip("."):
+        partition = partition.replace(".", "%2E")
+    root = os.path.realpath(os.path.join(Config.ARCHIVE_DIR, collection))
+    path = os.path.realpath(os.path.join(root, partition, f"{month}.jsonl.gz"))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError(f"Archive path of venue {venue!r} is outside {root}")
+    return path
+
+
+def _month_of(timestamp):
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(pytz.utc)
+    return timestamp.strftime("%Y-%m")
+
+
+def apply_retention_indexes():
+    # ttl mode lets mongo delete expired documents, archive mode must drop the index or documents
+    # would expire before the pruner archived them
+    db = get_db()
+    for collection, (days, _) in RETENTION_POLICIES.items():
+        indexes = db[collection].index_information()
+        existing = indexes.get(TTL_INDEX_NAME)
+        expire_after = days * 24 * 60 * 60
+
+        if Config.RETENTION_MODE != "ttl" or not days:
+            if existing:
+                db[collection].drop_index(TTL_INDEX_NAME)
+                print(f"Dropped the ttl index of {collection}")
+            continue
+
+        if existing and existing.get("expireAfterSeconds") == expire_after:
+            continue
+        try:
+            if existing:
+                db.command("collMod", collection, index={"name": TTL_INDEX_NAME, "expireAfterSeconds": expire_after})
+            else:
+                db[collection].create_index("timestamp", name=TTL_INDEX_NAME, expireAfterSeconds=expire_after)
+        except OperationFailure as e:
+            print(f"Failed to set the ttl index of {collection}: {e}")
+            continue
+        print(f"Documents of {collection} now expire after {days} days")
+
+
+def prune_collection(collection):
+    # archives the expired documents to gzip json lines, one file per venue and month, then deletes them.
+    # a crash between the two steps only duplicates lines, which read_archive skips
+    days, venue_field = RETENTION_POLICIES[collection]
+    if not days or Config.RETENTION_MODE != "archive":
+        return 0
+
+    db = get_db()
+    cutoff = datetime.now(pytz.utc) - timedelta(days=days)
+    pruned = 0
+
+    while True:
+        documents = list(
+            db[collection].find({"timestamp": {"$lt": cutoff}}).sort("_id", 1).limit(Config.RETENTION_BATCH_SIZE)
+        )
+        if not documents:
+            break
+
+        partitions = {}
+        for document in documents:
+            venue = document.get(venue_field) if venue_field else SHARED_PARTITION
+            key = (venue or SHARED_PARTITION, _month_of(document["timestamp"]))
+            partitions.setdefault(key, []).append(json_util.dumps(document))
+
+        for (venue, month), lines in partitions.items():
+            path = _archive_path(collection, venue, month)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # appending adds a gzip member, gzip.open reads the members back as one stream
+            with gzip.open(path, "at", encoding="utf-8") as file:
+                file.write("\n".join(lines) + "\n")
+
+        db[collection].delete_many({"_id": {"$in": [document["_id"] for document in documents]}})
+        pruned += len(documents)
+
+    if pruned:
+        print(f"Archived and pruned {pruned} documents of {collection} older than {days} days")
+    return pruned
+
+
+def run_retention():
+    apply_retention_indexes()
+    return {collection: prune_collection(collection) for collection in RETENTION_POLICIES}
+
+
+def _months_between(start, end):
+    month = datetime(start.year, start.month, 1)
+    while month <= end:
+        yield month.strftime("%Y-%m")
+        month = datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def read_archive(collection, venue=None, start=None, end=None, limit=1000):
+    # archived documents between start and end (naive utc datetimes), newest months first
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=365)
+    venue = venue or SHARED_PARTITION
+
+    documents = []
+    seen = set()
+    for month in reversed(list(_months_between(start, end))):
+        path = _archive_path(collection, venue, month)
+        if not os.path.exists(path):
+            continue
+
+        month_documents = []
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            for line in file:
+                document = json_util.loads(line)
+                timestamp = document["timestamp"].replace(tzinfo=None)
+                if document["_id"] in seen or not start <= timestamp <= end:
+                    continue
+                seen.add(document["_id"])
+                month_documents.append(document)
+
+        month_documents.sort(key=lambda document: document["timestamp"], reverse=True)
+        documents.extend(month_documents)
+        if len(documents) >= limit:
+            break
+
+    return documents[:limit]
@@ -0,0 +1,144 @@
+import csv
+import io
+
+from bson import ObjectId
+
+# rule collections of a venue and the fields of each row, the first field is the key of the rule
+RULE_FIELDS = {
+    "binMappings": ("binLocation", "pickingArea"),
+    "locationTransformations": ("original", "transformed"),
+    "overflowLocations": ("location",),
+}
+CSV_TYPES = {
+    "binMapping": "binMappings",
+    "locationTransformation": "locationTransformations",
+    "overflowLocation": "overflowLocations",
+}
+CSV_COLUMNS = ["type", "id", "binLocation", "pickingArea", "original", "transformed", "location"]
+
+
+def new_rule_id():
+    return str(ObjectId())
+
+
+def rule_key(rule_type, row):
+    # as saved, locations are matched case-sensitively so rules differing only by case are distinct
+    return row[RULE_FIELDS[rule_type][0]]
+
+
+def parse_csv_rules(text):
+    # only the rule types with at least one row are part of the import
+    rules = {}
+    errors = []
+    reader = csv.DictReader(io.StringIO(text))
+
+    for line, row in enumerate(reader, start=2):
+        rule_type = CSV_TYPES.get((row.get("type") or "").strip())
+        if not rule_type:
+            errors.append({"row": line, "error": f"Unknown rule type: {row.get('type')}"})
+            continue
+        rule = {field: row.get(field) for field in RULE_FIELDS[rule_type]}
+        if row.get("id"):
+            rule["id"] = row["id"]
+        rule["_row"] = line
+        rules.setdefault(rule_type, []).append(rule)
+
+    return rules, errors
+
+
+def export_csv_rules(settings):
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=CSV_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    csv_type_names = {rule_type: name for name, rule_type in CSV_TYPES.items()}
+
+    for rule_type in RULE_FIELDS:
+        for rule in settings.get(rule_type, []):
+            if isinstance(rule, str):
+                rule = {RULE_FIELDS[rule_type][0]: rule}
+            writer.writerow({"type": csv_type_names[rule_type], **rule})
+
+    return output.getvalue()
+
+
+def _clean_rule(rule_type, rule, position):
+    # returns (cleaned rule, error)
+    row = rule.pop("_row", position) if isinstance(rule, dict) else position
+    if isinstance(rule, str) and len(RULE_FIELDS[rule_type]) == 1:
+        rule = {RULE_FIELDS[rule_type][0]: rule}
+    if not isinstance(rule, dict):
+        return None, {"type": rule_type, "row": row, "error": "Rule must be an object"}
+
+    cleaned = {}
+    for field in RULE_FIELDS[rule_type]:
+        value = rule.get(field)
+        if not isinstance(value, str) or not value.strip():
+            return None, {"type": rule_type, "row": row, "error": f"Missing or invalid field: {field}"}
+        cleaned[field] = value.strip()
+
+    if rule.get("id") is not None:
+        cleaned["id"] = str(rule["id"])
+    cleaned["_row"] = row
+    return cleaned, None
+
+
+def build_rules(settings, imported, mode="merge"):
+    # validates every imported row in one pass, returns (rules, report, errors)
+    # in merge mode imported rows replace existing rows with the same key and keep their id,
+    # rule types missing from the import are left untouched in both modes
+    rules = {}
+    report = {}
+    errors = []
+
+    for rule_type, fields in RULE_FIELDS.items():
+        if rule_type not in imported:
+            continue
+
+        existing = {}
+        for rule in settings.get(rule_type, []) if mode == "merge" else []:
+            if isinstance(rule, str):
+                rule = {fields[0]: rule}
+            if isinstance(rule, dict) and rule.get(fields[0]):
+                existing[rule_key(rule_type, rule)] = rule
+
+        rows = imported[rule_type] or []
+        if not isinstance(rows, list):
+            errors.append({"type": rule_type, "error": "Expected a list of rules"})
+            continue
+
+        seen = {}
+        counts = {"added": 0, "updated": 0, "unchanged": 0, "duplicates": 0}
+        for position, rule in enumerate(rows, start=1):
+            cleaned, error = _clean_rule(rule_type, rule, position)
+            if error:
+                errors.append(error)
+                continue
+
+            row = cleaned.pop("_row")
+            key = rule_key(rule_type, cleaned)
+            if key in seen:
+                if all(seen[key][field] == cleaned[field] for field in fields):
+                    counts["duplicates"] += 1
+                else:
+                    errors.append({"type": rule_type, "row": row, "error": f"Conflicting rules for {key}"})
+                continue
+
+            current = existing.get(key)
+            if current:
+                cleaned["id"] = current.get("id") or cleaned.get("id") or new_rule_id()
+                unchanged = all(current.get(field) == cleaned[field] for field in fields)
+                counts["unchanged" if unchanged else "updated"] += 1
+            else:
+                cleaned["id"] = cleaned.get("id") or new_rule_id()
+                counts["added"] += 1
+            seen[key] = cleaned
+
+        # existing rules keep their position, new rules are appended
+        merged = [seen.pop(key, rule) for key, rule in existing.items()]
+        kept = len(existing) - counts["updated"] - counts["unchanged"]
+        rules[rule_type] = merged + list(seen.values())
+        report[rule_type] = {**counts, "kept": kept, "total": len(rules[rule_type])}
+
+    if not rules and not errors:
+        errors.append({"error": f"No rules to import, expected any of: {', '.join(RULE_FIELDS)}"})
+    return rules, report, errors
@@ -1,14 +1,101 @@
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.blocking import BlockingScheduler
+from app.config import Config
+from app.services.async_engine import run_venues_async
 from app.services.database import get_db
-from app.services.item_service import process_and_attach_items
+from app.services.item_service import check_unassigned_items_signal
+from app.services.picking_area_service import normalize_timestamp
+from app.services.queue_service import enqueue_venue_run, run_venue_now
+from app.services.retention_service import run_retention
+from app.services.upstream_service import get_validators, save_validators
 from datetime import datetime, timedelta
 import pytz
+import random
+import threading
+import time
 
 DAY_MAPPING = {
     "sunday": "sun", "monday": "mon", "tuesday": "tue", "wednesday": "wed",
     "thursday": "thu", "friday": "fri", "saturday": "sat"
 }
 
+def _venue_runner():
+    # in queue mode the tick only enqueues the run, worker.py processes pick it up
+    if Config.SCHEDULER_EXECUTION == "queue":
+        return enqueue_venue_run
+    if Config.EXECUTION_ENGINE == "async":
+        return lambda venue_id: run_venues_async([venue_id])
+    return run_venue_now
+
+def _batches_hourly_runs():
+    # the async engine runs every hourly venue in one event loop instead of one job per venue
+    return Config.EXECUTION_ENGINE == "async" and Config.SCHEDULER_EXECUTION != "queue"
+
+def run_hourly_venues():
+    db = get_db()
+    venue_ids = db.venue_settings.distinct("venue_id", {"schedule.scheduleType": {"$in": ["every_hour", None]}})
+    if venue_ids:
+        run_venues_async(venue_ids)
+
+def log_skipped_run(event):
+    # a tick is dropped when the previous run of the job is still going (max_instances) or came too late
+    reason = "the previous run is still going" if event.code == EVENT_JOB_MAX_INSTANCES else "it was missed"
+    print(f"Skipped a run of job {event.job_id}, {reason}")
+
+def _adaptive_bounds(schedule_info):
+    # minInterval / maxInterval are set in minutes on the venue schedule
+    min_interval = int(schedule_info.get("minInterval", 0) * 60) or Config.ADAPTIVE_MIN_INTERVAL
+    max_interval = int(schedule_info.get("maxInterval", 0) * 60) or Config.ADAPTIVE_MAX_INTERVAL
+    return min_interval, max(min_interval, max_interval)
+
+def _schedule_poll(scheduler, venue_id, delay):
+    scheduler.add_job(
+        poll_venue_signal, 'date',
+        run_date=datetime.now(pytz.utc) + timedelta(seconds=delay),
+        id=f"{venue_id}_schedule", args=[scheduler, venue_id],
+        replace_existing=True, misfire_grace_time=None
+    )
+
+def poll_venue_signal(scheduler, venue_id):
+    # runs the venue only when its unassigned items changed, the poll interval doubles while it stays idle
+    db = get_db()
+    venue = db.venue_settings.find_one({"venue_id": venue_id}, {"schedule": 1, "rulesVersion": 1})
+    schedule_info = (venue or {}).get("schedule", {})
+    if schedule_info.get("scheduleType") != "adaptive":
+        return
+
+    min_interval, max_interval = _adaptive_bounds(schedule_info)
+    state = get_validators(venue_id, "signal")
+    now = datetime.now(pytz.utc)
+
+    try:
+        changed = check_unassigned_items_signal(venue_id)
+    except Exception as e:
+        print(f"Signal check failed for venue {venue_id}: {e}")
+        changed = False
+    # rule edits since the last completed run count as a change too
+    if get_validators(venue_id, "inputs").get("rules_version", 0) != venue.get("rulesVersion", 0):
+        changed = True
+
+    last_run = normalize_timestamp(state.get("last_run"))
+    due = last_run is None or now - last_run >= timedelta(seconds=Config.ADAPTIVE_FULL_RUN_AFTER)
+
+    if changed or due:
+        interval = min_interval
+        save_validators(venue_id, "signal", {"interval": interval, "last_run": now})
+    else:
+        interval = min(max_interval, state.get("interval", min_interval) * Config.ADAPTIVE_BACKOFF)
+        save_validators(venue_id, "signal", {"interval": interval})
+
+    _schedule_poll(scheduler, venue_id, interval)
+
+    if changed or due:
+        print(f"Upstream changed for venue {venue_id}, starting run" if changed else f"Periodic run for venue {venue_id}")
+        _venue_runner()(venue_id)
+    else:
+        print(f"No change for venue {venue_id}, next check in {int(interval)}s")
+
 def add_or_update_job(scheduler, venue):
     venue_id = venue["venue_id"]
     schedule_info = venue.get("schedule", {})
@@ -20,14 +107,21 @@ def add_or_update_job(scheduler, venue):
     hours, minutes = map(int, custom_time.split(":"))
     job_id = f"{venue_id}_schedule"
     
+    run = _venue_runner()
+
     if scheduler.get_job(job_id):
         scheduler.remove_job(job_id)
         print(f"Removed old job for {venue_id}")
     
     if schedule_type == "every_hour":
-        scheduler.add_job(process_and_attach_items, 'cron', minute=0, id=job_id, args=[venue_id])
+        # with the async engine the hourly venues share the hourly_venues job
+        if not _batches_hourly_runs():
+            scheduler.add_job(run, 'cron', minute=0, id=job_id, args=[venue_id])
     elif schedule_type == "custom_time":
-        scheduler.add_job(process_and_attach_items, 'cron', hour=hours, minute=minutes, day_of_week=','.join(mapped_days), id=job_id, args=[venue_id])
+        scheduler.add_job(run, 'cron', hour=hours, minute=minutes, day_of_week=','.join(mapped_days), id=job_id, args=[venue_id])
+    elif schedule_type == "adaptive":
+        # spread the first checks so the venues do not poll in lockstep
+        _schedule_poll(scheduler, venue_id, random.uniform(0, _adaptive_bounds(schedule_info)[0]))
     
     print(f"Updated schedule for venue: {venue_id}, Type: {schedule_type}, Time: {custom_time}, Days: {mapped_days}")
 
@@ -36,5 +130,37 @@ def setup_schedulers(scheduler):
     venues = db.venue_settings.find()
     for venue in venues:
         add_or_update_job(scheduler, venue)
+    if _batches_hourly_runs():
+        # one slow venue must not cost every venue the next tick, run_venue bounds each venue by
+        # ASYNC_VENUE_TIMEOUT and a late tick still runs once within the hour
+        scheduler.add_job(
+            run_hourly_venues, 'cron', minute=0, id="hourly_venues", replace_existing=True,
+            coalesce=True, misfire_grace_time=30 * 60
+        )
+    scheduler.add_listener(log_skipped_run, EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED)
+    # archive and prune item_updates and history outside of the busy hours
+    scheduler.add_job(run_retention, 'cron', hour=3, minute=30, id="retention", replace_existing=True)
     if not scheduler.running:
-        scheduler.start()
\ No newline at end of file
+        scheduler.start()
+
+def _setup_with_retry(scheduler):
+    # the venue jobs are loaded from mongo, keep trying instead of failing once when it is not reachable yet
+    delay = Config.WARMUP_RETRY_INTERVAL
+    while True:
+        try:
+            setup_schedulers(scheduler)
+            return
+        except Exception as e:
+            print(f"Scheduler setup failed, retrying in {delay}s: {e}")
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
+
+def start_background_scheduler():
+    scheduler = BackgroundScheduler(timezone=pytz.timezone('Asia/Jerusalem'))
+    threading.Thread(target=_setup_with_retry, args=(scheduler,), daemon=True).start()
+    return scheduler
+
+def run_scheduler():
+    # dedicated scheduler process, blocks until interrupted
+    scheduler = BlockingScheduler(timezone=pytz.timezone('Asia/Jerusalem'))
+    setup_schedulers(scheduler)
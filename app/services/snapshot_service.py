@@ -0,0 +1,85 @@
+import hashlib
+import json
+import zlib
+
+from app.config import Config
+from app.services.database import get_db
+from bson import Binary
+from datetime import datetime
+import pytz
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _serialize(payload):
+    return json.dumps(payload, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+
+def _compress(raw):
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=Config.SNAPSHOT_COMPRESSION_LEVEL).compress(raw), "zstd"
+    return zlib.compress(raw, Config.SNAPSHOT_COMPRESSION_LEVEL), "zlib"
+
+
+def _decompress(data, encoding):
+    if encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read this snapshot")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if encoding == "zlib":
+        return zlib.decompress(data)
+    return data
+
+
+def save_snapshot(collection, venue_id, payload, item_count):
+    # returns False when the stored snapshot already has the same content
+    raw = _serialize(payload)
+    content_hash = hashlib.sha256(raw).hexdigest()
+
+    db = get_db()
+    stored = db[collection].find_one({"venue_id": venue_id}, {"content_hash": 1})
+    if stored and stored.get("content_hash") == content_hash:
+        return False
+
+    data, encoding = _compress(raw)
+    db[collection].update_one(
+        {"venue_id": venue_id},
+        {
+            "$set": {
+                "payload": Binary(data),
+                "encoding": encoding,
+                "content_hash": content_hash,
+                "item_count": item_count,
+                "size": len(raw),
+                "compressed_size": len(data),
+                "last_updated": datetime.now(pytz.utc)
+            },
+            # documents written before snapshots were compressed kept the raw payload under the collection name
+            "$unset": {collection: ""}
+        },
+        upsert=True
+    )
+    return True
+
+
+def load_snapshot(collection, venue_id):
+    db = get_db()
+    snapshot = db[collection].find_one({"venue_id": venue_id})
+    if not snapshot:
+        return None
+    if "payload" not in snapshot:
+        return snapshot.get(collection)
+    return json.loads(_decompress(snapshot["payload"], snapshot.get("encoding")))
+
+
+def get_snapshot_info(collection, venue_id):
+    # metadata only, the payload is never transferred
+    db = get_db()
+    snapshot = db[collection].find_one({"venue_id": venue_id}, {"payload": 0})
+    if snapshot and "item_count" not in snapshot and collection in snapshot:
+        legacy = snapshot.pop(collection)
+        snapshot["item_count"] = len(legacy.get("data", [])) if isinstance(legacy, dict) else len(legacy)
+    return snapshot
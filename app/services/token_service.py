@@ -1,6 +1,6 @@
 import time
 from app.services.database import get_db
-import requests
+from app.services.upstream_service import upstream_request
 
 def read_tokens_from_db():
     db = get_db()
@@ -24,7 +24,7 @@ def refresh_access_token():
     refresh_url = "<API_HOLDER>"
     payload = {'grant_type': 'refresh_token', 'refresh_token': refresh_token}
     headers = {'Content-Type': 'application/x-www-form-urlencoded'}
-    response = requests.post(refresh_url, data=payload, headers=headers)
+    response = upstream_request("POST", refresh_url, data=payload, headers=headers)
 
     if response.status_code == 200:
         data = response.json()
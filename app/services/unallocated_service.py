@@ -0,0 +1,96 @@
+from app.services.database import get_db
+from datetime import datetime
+from pymongo import DESCENDING, UpdateOne
+import pytz
+
+_indexes_ready = False
+
+
+def _ensure_indexes(db):
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    db.unallocated_items.create_index([("venue_id", 1), ("item_id", 1)], unique=True)
+    db.unallocated_items.create_index([("venue_id", 1), ("normalized_location", 1)])
+    db.unallocated_locations.create_index([("venue_id", 1), ("normalized_location", 1)], unique=True)
+    db.unallocated_locations.create_index([("venue_id", 1), ("count", -1)])
+    _indexes_ready = True
+
+
+def record_unallocated(venue_id, unallocated_items):
+    # replaces the venue's unallocated items and per-location counts with the result of this run
+    db = get_db()
+    _ensure_indexes(db)
+    now = datetime.now(pytz.utc)
+
+    counts = {}
+    item_operations = []
+    for item in unallocated_items:
+        location = item["normalizedLocation"]
+        counts[location] = counts.get(location, 0) + 1
+        item_operations.append(UpdateOne(
+            {"venue_id": venue_id, "item_id": item["itemId"]},
+            {
+                "$set": {"location": item["storageLocation"], "normalized_location": location, "last_seen": now},
+                "$setOnInsert": {"first_seen": now},
+            },
+            upsert=True
+        ))
+
+    location_operations = [
+        UpdateOne(
+            {"venue_id": venue_id, "normalized_location": location},
+            {"$set": {"count": count, "updated_at": now}},
+            upsert=True
+        )
+        for location, count in counts.items()
+    ]
+
+    if item_operations:
+        db.unallocated_items.bulk_write(item_operations, ordered=False)
+        db.unallocated_locations.bulk_write(location_operations, ordered=False)
+
+    # anything not seen in this run was allocated since, or is no longer unassigned
+    db.unallocated_items.delete_many({"venue_id": venue_id, "last_seen": {"$lt": now}})
+    db.unallocated_locations.delete_many({"venue_id": venue_id, "updated_at": {"$lt": now}})
+
+    # the results used to be embedded in the venue settings
+    db.venue_settings.update_one(
+        {"venue_id": venue_id, "unallocatedItems": {"$exists": True}},
+        {"$unset": {"unallocatedItems": ""}}
+    )
+    return len(item_operations)
+
+
+def get_unallocated_locations(venue_id, limit=100):
+    db = get_db()
+    cursor = db.unallocated_locations.find(
+        {"venue_id": venue_id},
+        {"_id": 0, "normalized_location": 1, "count": 1, "updated_at": 1}
+    ).sort("count", DESCENDING).limit(limit)
+    return [
+        {"location": row["normalized_location"], "count": row["count"], "updatedAt": row["updated_at"]}
+        for row in cursor
+    ]
+
+
+def get_unallocated_items(venue_id, location=None, limit=100, skip=0):
+    db = get_db()
+    query = {"venue_id": venue_id}
+    if location is not None:
+        query["normalized_location"] = location
+
+    cursor = db.unallocated_items.find(
+        query,
+        {"_id": 0, "item_id": 1, "location": 1, "normalized_location": 1, "first_seen": 1}
+    ).sort("item_id", 1).skip(skip).limit(limit)
+    items = [
+        {
+            "itemId": row["item_id"],
+            "storageLocation": row["location"],
+            "normalizedLocation": row["normalized_location"],
+            "firstSeen": row.get("first_seen"),
+        }
+        for row in cursor
+    ]
+    return items, db.unallocated_items.count_documents(query)
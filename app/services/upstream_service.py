@@ -0,0 +1,315 @@
+import asyncio
+import hashlib
+import threading
+import time
+
+from app.config import Config
+from app.services.database import get_db
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+import pytz
+import requests
+from datetime import datetime
+
+# returned by conditional fetches when the upstream payload did not change since the last run
+NOT_MODIFIED = object()
+# seconds between checks of an async waiter for a free slot, releases only notify threads
+ASYNC_RELEASE_POLL = 0.05
+
+
+class UpstreamUnavailable(Exception):
+    pass
+
+
+class HostLimiter:
+    # token bucket for the request rate plus an AIMD limit on the requests in flight
+
+    def __init__(self, host):
+        self.host = host
+        self.tokens = float(Config.UPSTREAM_BURST)
+        self.refilled_at = time.monotonic()
+        self.concurrency_limit = float(Config.UPSTREAM_INITIAL_CONCURRENCY)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.condition = threading.Condition()
+        self.stats = {"requests": 0, "throttled": 0, "errors": 0, "waited_seconds": 0.0}
+
+    def _refill(self, now):
+        elapsed = now - self.refilled_at
+        self.tokens = min(Config.UPSTREAM_BURST, self.tokens + elapsed * Config.UPSTREAM_RATE_LIMIT)
+        self.refilled_at = now
+
+    def _try_take(self, started):
+        # called with the condition held. Returns 0 once a slot was taken, otherwise the seconds to
+        # wait before trying again, None when only a release can free a slot
+        now = time.monotonic()
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.in_flight >= int(self.concurrency_limit):
+            return None
+        if self.tokens < 1:
+            return (1 - self.tokens) / Config.UPSTREAM_RATE_LIMIT
+        self.tokens -= 1
+        self.in_flight += 1
+        self.stats["requests"] += 1
+        self.stats["waited_seconds"] += now - started
+        return 0
+
+    def acquire(self):
+        started = time.monotonic()
+        with self.condition:
+            while True:
+                wait = self._try_take(started)
+                if wait == 0:
+                    return
+                self.condition.wait(wait)
+
+    async def acquire_async(self):
+        # same limits for the async engine, the event loop sleeps instead of blocking on the condition
+        started = time.monotonic()
+        while True:
+            with self.condition:
+                wait = self._try_take(started)
+            if wait == 0:
+                return
+            await asyncio.sleep(ASYNC_RELEASE_POLL if wait is None else wait)
+
+    def release(self, failed, throttled=False, retry_after=None):
+        with self.condition:
+            self.in_flight -= 1
+            if failed:
+                self.concurrency_limit = max(Config.UPSTREAM_MIN_CONCURRENCY, self.concurrency_limit / 2)
+                self.stats["errors"] += 1
+                if throttled:
+                    self.stats["throttled"] += 1
+                if retry_after:
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            else:
+                # roughly +1 per window of successful requests
+                self.concurrency_limit = min(
+                    Config.UPSTREAM_MAX_CONCURRENCY,
+                    self.concurrency_limit + 1 / self.concurrency_limit
+                )
+            self.condition.notify_all()
+
+    def cancel(self):
+        # frees the slot of a request that was cancelled before it had an outcome, the limit stays as it is
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def snapshot(self):
+        with self.condition:
+            return {
+                "concurrencyLimit": round(self.concurrency_limit, 2),
+                "inFlight": self.in_flight,
+                "tokens": round(self.tokens, 2),
+                "blockedFor": max(0.0, round(self.blocked_until - time.monotonic(), 2)),
+                **self.stats,
+            }
+
+
+class CircuitBreaker:
+    # opens after consecutive failures, lets a single trial request through once the timeout passed
+
+    def __init__(self, key):
+        self.key = key
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < Config.CIRCUIT_RESET_TIMEOUT or self.trial_in_flight:
+                return False
+            self.trial_in_flight = True
+            return True
+
+    def record(self, failed):
+        with self.lock:
+            self.trial_in_flight = False
+            if not failed:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.failures >= Config.CIRCUIT_FAILURE_THRESHOLD:
+                if self.opened_at is None:
+                    print(f"Circuit opened for {self.key} after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+    def cancel_trial(self):
+        # the trial request never got an answer, the next allow() lets another one through
+        with self.lock:
+            self.trial_in_flight = False
+
+    def snapshot(self):
+        with self.lock:
+            if self.opened_at is None:
+                state = "closed"
+            elif time.monotonic() - self.opened_at < Config.CIRCUIT_RESET_TIMEOUT:
+                state = "open"
+            else:
+                state = "half_open"
+            return {"state": state, "consecutiveFailures": self.failures}
+
+
+_limiters = {}
+_breakers = {}
+_registry_lock = threading.Lock()
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=Config.HTTP_POOL_SIZE,
+                    pool_maxsize=Config.HTTP_POOL_SIZE
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def reset_http_session():
+    # called after a fork so that workers never share pooled sockets with the parent
+    global _session
+    with _session_lock:
+        _session = None
+
+
+def _get_limiter(host):
+    with _registry_lock:
+        if host not in _limiters:
+            _limiters[host] = HostLimiter(host)
+        return _limiters[host]
+
+
+def _get_breaker(key):
+    with _registry_lock:
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker(key)
+        return _breakers[key]
+
+
+def _parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(pytz.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def upstream_request(method, url, venue_id=None, **kwargs):
+    # every call to the upstream api goes through here so that item and token calls share the limits
+    parsed = urlparse(url)
+    host = f"{parsed.scheme}://{parsed.netloc}"
+    breaker = _get_breaker(venue_id or host)
+
+    if not breaker.allow():
+        raise UpstreamUnavailable(f"Circuit open for {venue_id or host}, skipping {method} {url}")
+
+    limiter = _get_limiter(host)
+    kwargs.setdefault("timeout", Config.UPSTREAM_TIMEOUT)
+    limiter.acquire()
+    try:
+        response = get_http_session().request(method, url, **kwargs)
+    except requests.RequestException:
+        limiter.release(failed=True)
+        breaker.record(failed=True)
+        raise
+
+    throttled = response.status_code == 429
+    failed = throttled or response.status_code >= 500
+    limiter.release(failed, throttled, _parse_retry_after(response.headers.get("Retry-After")))
+    breaker.record(failed)
+    return response
+
+
+def get_upstream_metrics():
+    with _registry_lock:
+        limiters = list(_limiters.values())
+        breakers = list(_breakers.values())
+    return {
+        "hosts": {limiter.host: limiter.snapshot() for limiter in limiters},
+        "circuits": {breaker.key: breaker.snapshot() for breaker in breakers},
+    }
+
+
+def get_validators(venue_id, endpoint):
+    db = get_db()
+    return db.fetch_validators.find_one({"venue_id": venue_id, "endpoint": endpoint}) or {}
+
+
+def save_validators(venue_id, endpoint, validators):
+    db = get_db()
+    db.fetch_validators.update_one(
+        {"venue_id": venue_id, "endpoint": endpoint},
+        {"$set": {**validators, "last_checked": datetime.now(pytz.utc)}},
+        upsert=True
+    )
+
+
+def clear_validators(venue_id, endpoint=None):
+    db = get_db()
+    query = {"venue_id": venue_id}
+    if endpoint:
+        query["endpoint"] = endpoint
+    db.fetch_validators.delete_many(query)
+
+
+def commit_validators(venue_id, pending):
+    # pending is {endpoint: validators} collected by conditional_get(..., pending=...)
+    for endpoint, validators in pending.items():
+        save_validators(venue_id, endpoint, validators)
+
+
+def conditional_get(venue_id, endpoint, url, headers, pending=None):
+    # sends If-None-Match / If-Modified-Since from the previous response of the same endpoint,
+    # and falls back to comparing a hash of the body when the upstream ignores them. With a pending
+    # dict the new validators are only collected, the caller commits them once the payload was used
+    validators = get_validators(venue_id, endpoint)
+    request_headers = dict(headers)
+    if validators.get("etag"):
+        request_headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        request_headers["If-Modified-Since"] = validators["last_modified"]
+
+    response = upstream_request("GET", url, venue_id=venue_id, headers=request_headers)
+
+    if response.status_code == 304:
+        if pending is None:
+            save_validators(venue_id, endpoint, {})
+        return response, False
+
+    if response.status_code != 200:
+        return response, True
+
+    content_hash = hashlib.sha256(response.content).hexdigest()
+    changed = content_hash != validators.get("content_hash")
+    new_validators = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "content_hash": content_hash,
+    }
+    if pending is None:
+        save_validators(venue_id, endpoint, new_validators)
+    else:
+        pending[endpoint] = new_validators
+    return response, changed
@@ -0,0 +1,44 @@
+import threading
+import time
+
+from app.config import Config
+from app.services.database import get_db
+from flask_jwt_extended import get_jwt_identity
+
+# username -> (expires_at, user document without the password), per process
+_cache = {}
+_lock = threading.Lock()
+
+
+def find_user(username):
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(username)
+    if entry and entry[0] > now:
+        return dict(entry[1])
+
+    db = get_db()
+    user = db.users.find_one({'username': username}, {'password': 0})
+    if not user:
+        return None
+
+    with _lock:
+        _cache[username] = (now + Config.USER_CACHE_TTL, user)
+    return dict(user)
+
+
+def get_current_user():
+    # the user behind the jwt of the current request, role and venue_id are always up to date
+    # within USER_CACHE_TTL, or immediately in this process after a change through the api
+    return find_user(get_jwt_identity())
+
+
+def invalidate_user(*usernames):
+    with _lock:
+        for username in usernames:
+            _cache.pop(username, None)
+
+
+def invalidate_all_users():
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+
+from app.config import Config
+from app.services.database import get_client, get_db
+
+_state = {
+    "status": "pending",
+    "pid": None,
+    "appCreatedIn": None,
+    "startedAt": None,
+    "warmedIn": None,
+    "venues": 0,
+    "pickingAreas": 0,
+    "attempts": 0,
+    "error": None,
+}
+_lock = threading.Lock()
+_process_started = time.monotonic()
+
+
+def mark_app_created(seconds):
+    _state["appCreatedIn"] = round(seconds, 3)
+
+
+def start_warmup():
+    # loads the venue caches in the background, once per process (a forked worker starts its own)
+    with _lock:
+        if _state["pid"] == os.getpid() and _state["status"] in ["warming", "ready"]:
+            return
+        _state.update({"status": "warming", "pid": os.getpid(), "startedAt": time.time(), "error": None, "attempts": 0})
+
+    if not Config.WARMUP:
+        _state["status"] = "ready"
+        return
+
+    threading.Thread(target=_warmup_loop, name="warmup", daemon=True).start()
+
+
+def _warmup_loop():
+    started = time.monotonic()
+    delay = Config.WARMUP_RETRY_INTERVAL
+    while True:
+        _state["attempts"] += 1
+        try:
+            _warm()
+        except Exception as e:
+            print(f"Warm-up failed (attempt {_state['attempts']}), retrying in {delay}s: {e}")
+            _state.update({"status": "failed", "error": str(e)})
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
+            continue
+
+        _state.update({"status": "ready", "error": None, "warmedIn": round(time.monotonic() - started, 3)})
+        print(f"Warm-up finished in {_state['warmedIn']}s: {_state['venues']} venues, {_state['pickingAreas']} picking areas")
+        return
+
+
+def _warm():
+    from app.services.picking_area_service import load_stored_picking_areas
+    from app.services.webhook_service import get_area_index, get_compiled_rules
+
+    get_client().admin.command("ping")
+
+    db = get_db()
+    projection = {"venue_id": 1, "rulesVersion": 1, "binMappings": 1, "locationTransformations": 1, "overflowLocations": 1}
+    venues = 0
+    picking_area_count = 0
+    for venue_settings in db.venue_settings.find({}, projection):
+        venues += 1
+        get_compiled_rules(venue_settings)
+        # mongo only, the scheduler refreshes stale or missing copies from the upstream
+        picking_areas = load_stored_picking_areas(venue_settings["venue_id"])
+        if picking_areas:
+            get_area_index(venue_settings["venue_id"], picking_areas)
+            picking_area_count += 1
+
+    _state.update({"venues": venues, "pickingAreas": picking_area_count})
+
+
+def get_warmup_state():
+    if _state["pid"] != os.getpid():
+        # never started in this process (plain gunicorn or flask run), or inherited from a preloading
+        # parent whose warm-up thread did not survive the fork
+        start_warmup()
+    return {**_state, "uptime": round(time.monotonic() - _process_started, 3)}
+
+
+def is_ready():
+    return get_warmup_state()["status"] == "ready"
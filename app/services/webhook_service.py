@@ -0,0 +1,196 @@
+import atexit
+import hashlib
+import hmac
+import threading
+import time
+
+from app.config import Config
+from app.models import CompiledRules, load_picking_areas
+from app.services.cache_service import bump_generation
+from app.services.database import get_db
+from app.services.item_service import (
+    attach_items_to_picking_routes, compute_assignment_delta, get_best_picking_area, record_assignments
+)
+from app.services.picking_area_service import get_picking_areas
+from app.services.queue_service import new_worker_id, run_with_lease
+from datetime import datetime
+from pymongo.errors import DuplicateKeyError
+import pytz
+
+# venue_id -> {item_id: event}, later events for the same item replace earlier ones
+_pending = {}
+_timers = {}
+_lock = threading.Lock()
+
+# venue_id -> (rulesVersion, CompiledRules) and venue_id -> (last_updated, PickingAreaIndex)
+_rules_cache = {}
+_areas_cache = {}
+
+_delivery_indexes_ready = False
+
+
+def verify_signature(venue_id, body, signature, timestamp, delivery_id):
+    # the venue, the delivery id and the timestamp are signed with the body, so a captured request can
+    # neither be sent to another venue nor replayed once WEBHOOK_TOLERANCE passed
+    if not Config.WEBHOOK_SECRET or not signature or not timestamp or not delivery_id:
+        return False
+    try:
+        sent_at = float(timestamp)
+    except ValueError:
+        return False
+    if abs(time.time() - sent_at) > Config.WEBHOOK_TOLERANCE:
+        return False
+
+    if signature.startswith("sha256="):
+        signature = signature[len("sha256="):]
+    message = f"{timestamp}.{delivery_id}.{venue_id}.".encode() + body
+    expected = hmac.new(Config.WEBHOOK_SECRET.encode(), message, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def register_delivery(venue_id, delivery_id):
+    # False when the delivery was already received, replays within the tolerance window are dropped here
+    global _delivery_indexes_ready
+    db = get_db()
+    if not _delivery_indexes_ready:
+        # a delivery older than the tolerance is rejected by its timestamp, its id is no longer needed
+        db.webhook_deliveries.create_index("received_at", expireAfterSeconds=2 * Config.WEBHOOK_TOLERANCE)
+        _delivery_indexes_ready = True
+    try:
+        db.webhook_deliveries.insert_one(
+            {"_id": f"{venue_id}:{delivery_id}", "venue_id": venue_id, "received_at": datetime.now(pytz.utc)}
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+def enqueue_item_events(venue_id, events):
+    # returns the number of events accepted, items are assigned when the venue's batch window closes
+    accepted = 0
+    with _lock:
+        pending = _pending.setdefault(venue_id, {})
+        for event in events:
+            item_id = event.get("itemId") or event.get("id")
+            if not item_id or not event.get("storageLocation"):
+                continue
+            pending[item_id] = event
+            accepted += 1
+
+        if pending:
+            _schedule_flush(venue_id, Config.WEBHOOK_BATCH_WINDOW)
+
+    return accepted
+
+
+def _schedule_flush(venue_id, delay):
+    # called with _lock held
+    if venue_id in _timers:
+        return
+    timer = threading.Timer(delay, flush_venue_events, args=[venue_id])
+    timer.daemon = True
+    _timers[venue_id] = timer
+    timer.start()
+
+
+def get_compiled_rules(venue_settings):
+    venue_id = venue_settings["venue_id"]
+    version = venue_settings.get("rulesVersion")
+    cached = _rules_cache.get(venue_id)
+    if cached and cached[0] == version:
+        return cached[1]
+    rules = CompiledRules.from_settings(venue_settings)
+    _rules_cache[venue_id] = (version, rules)
+    return rules
+
+
+def get_area_index(venue_id, picking_areas):
+    cached = _areas_cache.get(venue_id)
+    if cached and cached[0] == picking_areas.get("last_updated"):
+        return cached[1]
+    index = load_picking_areas(picking_areas["picking_areas"])
+    _areas_cache[venue_id] = (picking_areas.get("last_updated"), index)
+    return index
+
+
+def flush_venue_events(venue_id, retry=True):
+    with _lock:
+        events = _pending.pop(venue_id, {})
+        _timers.pop(venue_id, None)
+
+    if not events:
+        return []
+
+    try:
+        # the venue lease keeps the batch from racing a scheduled or worker run of the same venue
+        acquired, attached_items = run_with_lease(
+            venue_id, new_worker_id(), lambda lost: assign_events(venue_id, events, lost)
+        )
+    except Exception as e:
+        # the items stay unassigned upstream and are picked up by the next scheduled run
+        print(f"Failed to assign {len(events)} webhook items for venue {venue_id}: {e}")
+        return []
+
+    if not acquired:
+        if not retry:
+            print(f"Venue {venue_id} is running elsewhere, leaving {len(events)} webhook items to the next run")
+            return []
+        with _lock:
+            # newer events for the same items win
+            pending = _pending.setdefault(venue_id, {})
+            for item_id, event in events.items():
+                pending.setdefault(item_id, event)
+            _schedule_flush(venue_id, Config.WEBHOOK_RETRY_INTERVAL)
+        print(f"Venue {venue_id} is running elsewhere, retrying {len(events)} webhook items in {Config.WEBHOOK_RETRY_INTERVAL}s")
+        return []
+
+    return attached_items
+
+
+def assign_events(venue_id, events, lease_lost=None):
+    db = get_db()
+    projection = {"venue_id": 1, "rulesVersion": 1, "binMappings": 1, "locationTransformations": 1, "overflowLocations": 1}
+    venue_settings = db.venue_settings.find_one({"venue_id": venue_id}, projection)
+    if not venue_settings:
+        print(f"Venue not found: {venue_id} in assign_events")
+        return []
+
+    picking_areas = get_picking_areas(venue_id)
+    if not picking_areas:
+        print(f"No picking areas cached for venue: {venue_id}, leaving {len(events)} webhook items to the next run")
+        return []
+
+    rules = get_compiled_rules(venue_settings)
+    picking_area_index = get_area_index(venue_id, picking_areas)
+
+    assigned_items = []
+    for item_id, event in events.items():
+        picking_area_id = get_best_picking_area(rules, event["storageLocation"], picking_area_index)
+        if picking_area_id:
+            assigned_items.append({
+                "itemId": item_id,
+                "pickingAreaId": picking_area_id,
+                "pickingAreaName": picking_area_index.name_of(picking_area_id),
+                "storageLocation": event["storageLocation"],
+            })
+
+    changed_items, previous_assignments = compute_assignment_delta(venue_id, assigned_items)
+    attached_items = attach_items_to_picking_routes(venue_id, changed_items, lease_lost=lease_lost)
+    # the events carry the product details the journal needs, no catalog download
+    record_assignments(venue_id, attached_items, previous_assignments, events)
+    if attached_items:
+        bump_generation(venue_id)
+    print(f"Webhook batch for venue {venue_id}: {len(events)} events, {len(assigned_items)} assigned, {len(attached_items)} attached")
+    return attached_items
+
+
+def flush_all_events():
+    with _lock:
+        venue_ids = list(_pending)
+        for timer in _timers.values():
+            timer.cancel()
+    for venue_id in venue_ids:
+        flush_venue_events(venue_id, retry=False)
+
+
+atexit.register(flush_all_events)
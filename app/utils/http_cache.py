@@ -0,0 +1,87 @@
+import gzip
+from functools import wraps
+
+from flask import current_app, make_response, request
+from app.config import Config
+from app.services.cache_service import get_generation, get_response, store_response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def etag_response(view):
+    # weak etag over the json body, answers If-None-Match with 304 and stays valid when compressed
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        response = make_response(view(*args, **kwargs))
+        if request.method != 'GET' or response.status_code != 200 or response.direct_passthrough:
+            return response
+
+        response.add_etag(weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Authorization')
+        return response.make_conditional(request)
+    return wrapper
+
+
+def cached_response(venue_key):
+    # per-venue cache of successful GET bodies, dropped when the venue generation is bumped.
+    # venue_key returns None to bypass the cache, e.g. for a caller the view would reject
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            venue_id = venue_key() if request.method == 'GET' else None
+            if not venue_id:
+                return view(*args, **kwargs)
+
+            key = (request.endpoint, venue_id, tuple(sorted(kwargs.items())), tuple(sorted(request.args.items(multi=True))))
+            generation = get_generation(venue_id)
+            cached = get_response(key, generation)
+            if cached:
+                body, etag = cached
+                response = current_app.response_class(body, mimetype='application/json')
+                response.set_etag(etag, weak=True)
+                return response
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.direct_passthrough:
+                response.add_etag(weak=True)
+                store_response(key, generation, response.get_data(), response.get_etag()[0])
+            return response
+        return wrapper
+    return decorator
+
+
+def _accepted_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_response(response):
+    # registered as an after_request hook for every blueprint
+    if (response.status_code != 200 or response.direct_passthrough
+            or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < Config.COMPRESS_MIN_SIZE:
+        return response
+
+    encoding = _accepted_encoding()
+    if encoding == 'br':
+        response.set_data(brotli.compress(data, quality=min(Config.COMPRESS_LEVEL, 11)))
+    elif encoding == 'gzip':
+        response.set_data(gzip.compress(data, compresslevel=Config.COMPRESS_LEVEL))
+    else:
+        return response
+
+    response.headers['Content-Encoding'] = encoding
+    return response
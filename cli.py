@@ -0,0 +1,210 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from app.config import Config
+from app.services.async_engine import run_venues_async
+from app.services.database import get_db, reset_client
+from app.services.item_service import (
+    fetch_all_items_information, fetch_itemconfigs, fetch_unassigned_items, match_items, process_and_attach_items
+)
+from app.services.picking_area_service import get_picking_areas
+from app.services.queue_service import new_worker_id, run_with_lease
+from app.services.upstream_service import reset_http_session
+
+# recorded payloads, one directory per venue: <snapshots>/<venue_id>/<name>.json
+SNAPSHOT_FILES = ["picking_areas", "item_configs", "unassigned_items", "all_items"]
+
+
+def _init_worker(quiet):
+    # every pool process opens its own mongo and http pools
+    reset_client()
+    reset_http_session()
+    if quiet:
+        # stdout carries the json report, the pipeline logs go to stderr
+        sys.stdout = sys.stderr
+
+
+def _load_snapshot_file(directory, venue_id, name):
+    path = os.path.join(directory, venue_id, f"{name}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def record_venue(venue_id, directory):
+    started = time.perf_counter()
+    picking_areas = get_picking_areas(venue_id, force_refresh=True)
+    payloads = {
+        "picking_areas": picking_areas['picking_areas'] if picking_areas else None,
+        "item_configs": fetch_itemconfigs(venue_id),
+        "unassigned_items": fetch_unassigned_items(venue_id),
+        "all_items": fetch_all_items_information(venue_id),
+    }
+
+    os.makedirs(os.path.join(directory, venue_id), exist_ok=True)
+    for name, payload in payloads.items():
+        with open(os.path.join(directory, venue_id, f"{name}.json"), 'w', encoding='utf-8') as file:
+            json.dump(payload, file)
+
+    return {
+        "venue": venue_id,
+        "status": "recorded",
+        "files": [name for name, payload in payloads.items() if payload is not None],
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def run_venue_from_snapshots(venue_id, directory):
+    # matching only, nothing is written to mongo or sent upstream
+    started = time.perf_counter()
+    venue_settings = get_db().venue_settings.find_one({"venue_id": venue_id})
+    if not venue_settings:
+        return {"venue": venue_id, "status": "skipped", "reason": "Venue not found"}
+
+    payloads = {name: _load_snapshot_file(directory, venue_id, name) for name in SNAPSHOT_FILES[:3]}
+    missing = [name for name, payload in payloads.items() if payload is None]
+    if missing:
+        return {"venue": venue_id, "status": "skipped", "reason": f"Missing snapshots: {', '.join(missing)}"}
+    loaded = time.perf_counter()
+
+    assigned_items, unavailable_items, unallocated_items = match_items(
+        venue_settings, payloads["unassigned_items"], payloads["item_configs"], payloads["picking_areas"]
+    )
+    matched = time.perf_counter()
+
+    areas = {}
+    for item in assigned_items:
+        areas[item["pickingAreaName"]] = areas.get(item["pickingAreaName"], 0) + 1
+
+    return {
+        "venue": venue_id,
+        "status": "completed",
+        "itemConfigs": len(payloads["item_configs"]),
+        "unassignedItems": len(payloads["unassigned_items"]["data"]),
+        "assigned": len(assigned_items),
+        "unavailable": len(unavailable_items),
+        "unallocated": len(unallocated_items),
+        "areas": areas,
+        "timings": {"load": round(loaded - started, 3), "match": round(matched - loaded, 3)},
+        "seconds": round(matched - started, 3),
+    }
+
+
+def run_venue_live(venue_id, force):
+    started = time.perf_counter()
+    stages = {}
+    last = [started, None]
+
+    def progress(stage, **counts):
+        now = time.perf_counter()
+        if last[1]:
+            stages[last[1]] = round(now - last[0], 3)
+        last[0], last[1] = now, stage
+
+    acquired, result = run_with_lease(
+        venue_id, new_worker_id(),
+        lambda lost: process_and_attach_items(venue_id, force=force, progress=progress, lease_lost=lost)
+    )
+    finished = time.perf_counter()
+    if last[1]:
+        stages[last[1]] = round(finished - last[0], 3)
+
+    if not acquired:
+        return {"venue": venue_id, "status": "skipped", "reason": "Already running on another worker"}
+
+    return {
+        "venue": venue_id,
+        **(result or {}),
+        "timings": stages,
+        "seconds": round(finished - started, 3),
+    }
+
+
+def run_venue(venue_id, mode, directory, force):
+    try:
+        if mode == "record":
+            return record_venue(venue_id, directory)
+        if mode == "snapshots":
+            return run_venue_from_snapshots(venue_id, directory)
+        return run_venue_live(venue_id, force)
+    except Exception as e:
+        return {"venue": venue_id, "status": "failed", "error": str(e)}
+
+
+def print_report(reports):
+    print(f"{'venue':<24}{'status':<12}{'assigned':>10}{'unavail.':>10}{'unalloc.':>10}{'seconds':>10}")
+    for report in reports:
+        print(
+            f"{report['venue']:<24}{report.get('status', ''):<12}"
+            f"{report.get('assigned', '-'):>10}{report.get('unavailable', '-'):>10}"
+            f"{report.get('unallocated', '-'):>10}{report.get('seconds', '-'):>10}"
+        )
+        if report.get('reason') or report.get('error'):
+            print(f"    {report.get('reason') or report.get('error')}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the picking route assignment without the web app")
+    parser.add_argument("venues", nargs="*", help="venue ids to run")
+    parser.add_argument("--all", action="store_true", help="run every venue in venue_settings")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="size of the process pool")
+    parser.add_argument("--snapshots", metavar="DIR", help="match from recorded snapshot files instead of the upstream")
+    parser.add_argument("--record", metavar="DIR", help="download the upstream payloads into snapshot files")
+    parser.add_argument("--force", action="store_true", help="download full payloads even if unchanged")
+    parser.add_argument("--json", metavar="FILE", help="write the report as json, - for stdout")
+    args = parser.parse_args(argv)
+
+    venues = args.venues
+    if args.all:
+        venues = sorted(get_db().venue_settings.distinct("venue_id"))
+    if not venues:
+        parser.error("no venues given, pass venue ids or --all")
+
+    if args.record:
+        mode, directory = "record", args.record
+    elif args.snapshots:
+        mode, directory = "snapshots", args.snapshots
+    else:
+        mode, directory = "live", None
+
+    started = time.perf_counter()
+    reports = []
+    quiet = args.json == "-"
+    with contextlib.redirect_stdout(sys.stderr) if quiet else contextlib.nullcontext():
+        if mode == "live" and Config.EXECUTION_ENGINE == "async":
+            # one event loop for every venue instead of the process pool
+            results = run_venues_async(venues, force=args.force)
+            reports = [{"venue": venue_id, **result} for venue_id, result in results.items()]
+        else:
+            with ProcessPoolExecutor(
+                max_workers=min(args.workers, len(venues)), initializer=_init_worker, initargs=(quiet,)
+            ) as pool:
+                futures = [pool.submit(run_venue, venue_id, mode, directory, args.force) for venue_id in venues]
+                for future in as_completed(futures):
+                    reports.append(future.result())
+    reports.sort(key=lambda report: report["venue"])
+    elapsed = round(time.perf_counter() - started, 3)
+
+    if args.json:
+        output = json.dumps({"mode": mode, "seconds": elapsed, "venues": reports}, indent=2, default=str)
+        if args.json == "-":
+            print(output)
+        else:
+            with open(args.json, 'w', encoding='utf-8') as file:
+                file.write(output)
+    else:
+        print_report(reports)
+        print(f"{len(reports)} venues in {elapsed}s ({mode})")
+
+    return 0 if all(report.get("status") != "failed" for report in reports) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
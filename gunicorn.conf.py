@@ -0,0 +1,30 @@
+import multiprocessing
+import os
+
+# web workers never run the venue jobs, they belong to the dedicated scheduler process (scheduler.py)
+os.environ.setdefault("RUN_SCHEDULER", "false")
+
+wsgi_app = "wsgi:app"
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:9000")
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")  # or "gevent"
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 1000))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+preload_app = True
+accesslog = "-"
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    # mongo and http connection pools are created lazily, drop anything inherited from the master
+    from app.services.database import reset_client
+    from app.services.upstream_service import reset_http_session
+    from app.services.warmup_service import start_warmup
+
+    reset_client()
+    reset_http_session()
+    # threads do not survive the fork, every worker warms its own caches
+    start_warmup()
@@ -0,0 +1,175 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+# paths served by the stub, the venue settings seeded by run.py point at them
+ITEM_CONFIG_ENDPOINT = "/v1/item-configs"
+UNASSIGNED_ITEMS_ENDPOINT = "/v1/unassigned-items"
+ALL_ITEMS_ENDPOINT = "/v1/all-items"
+
+PICKING_AREAS_PATH = re.compile(r"^/v1/venues/(?P<venue>[^/]+)/picking-areas$")
+ATTACH_PATH = re.compile(r"^/v1/venues/(?P<venue>[^/]+)/picking-areas/(?P<area>[^/]+)/items$")
+
+
+class Catalog:
+    # deterministic fake catalog: items spread over aisles, a share of them unassigned
+    # locations look like Z1-A03-12, which normalize to the area name Z1-A03
+
+    def __init__(self, size, areas, unassigned_ratio, seed=42):
+        rng = random.Random(seed)
+        self.areas = [{"id": f"area-{i}", "name": f"Z1-A{i:02d}", "order": i, "itemsCount": 0} for i in range(areas)]
+        self.items = []
+        for i in range(size):
+            aisle = rng.randrange(areas + 2)  # the last two aisles have no picking area
+            self.items.append({
+                "itemId": f"item-{i}",
+                "storageLocation": f"Z1-A{aisle:02d}-{rng.randrange(20):02d}",
+            })
+        self.unassigned = [{"id": item["itemId"]} for item in self.items if rng.random() < unassigned_ratio]
+        self.all_items = [
+            {"id": item["itemId"], "name": f"Product {i}", "imageUrl": f"https://img.example/{i}.jpg", "gtin": f"{i:013d}"}
+            for i, item in enumerate(self.items)
+        ]
+        self.bodies = {
+            "picking_areas": json.dumps({"data": self.areas}).encode(),
+            "item_configs": json.dumps(self.items).encode(),
+            "unassigned_items": json.dumps({"data": self.unassigned}).encode(),
+            "all_items": json.dumps({"data": self.all_items}).encode(),
+        }
+
+
+class FakeUpstream:
+
+    def __init__(self, catalog, latency_ms=0, jitter_ms=0, error_rate=0.0, host="127.0.0.1", port=0):
+        self.catalog = catalog
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-upstream", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        with self.lock:
+            return {endpoint: dict(counts) for endpoint, counts in self.calls.items()}
+
+    def _count(self, endpoint, status):
+        with self.lock:
+            counts = self.calls.setdefault(endpoint, {})
+            counts[status] = counts.get(status, 0) + 1
+
+    def _handler(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, endpoint, status, body=b"", headers=None):
+                upstream._count(endpoint, status)
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _delay_or_fail(self, endpoint):
+                delay = upstream.latency_ms + random.uniform(0, upstream.jitter_ms)
+                if delay:
+                    time.sleep(delay / 1000)
+                if upstream.error_rate and random.random() < upstream.error_rate:
+                    self._send(endpoint, 503, b'{"error": "injected failure"}', {"Retry-After": "1"})
+                    return True
+                return False
+
+            def _send_payload(self, endpoint):
+                body = upstream.catalog.bodies[endpoint]
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    self._send(endpoint, 304, headers={"ETag": etag})
+                else:
+                    self._send(endpoint, 200, body, {"ETag": etag})
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path == "/__stats":
+                    body = json.dumps(upstream.stats()).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+
+                if PICKING_AREAS_PATH.match(path):
+                    endpoint = "picking_areas"
+                elif path == ITEM_CONFIG_ENDPOINT:
+                    endpoint = "item_configs"
+                elif path == UNASSIGNED_ITEMS_ENDPOINT:
+                    endpoint = "unassigned_items"
+                elif path == ALL_ITEMS_ENDPOINT:
+                    endpoint = "all_items"
+                else:
+                    self._send("unknown", 404, b'{"error": "not found"}')
+                    return
+
+                if not self._delay_or_fail(endpoint):
+                    self._send_payload(endpoint)
+
+            def do_POST(self):
+                path = urlparse(self.path).path
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+
+                if not ATTACH_PATH.match(path):
+                    self._send("unknown", 404, b'{"error": "not found"}')
+                    return
+                if not self._delay_or_fail("attach"):
+                    with upstream.lock:
+                        upstream.calls.setdefault("attached_items", {"count": 0})["count"] += len(payload.get("data", []))
+                    self._send("attach", 200, b'{"status": "ok"}')
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local stand-in for the upstream picking api")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--catalog-size", type=int, default=5000)
+    parser.add_argument("--areas", type=int, default=20)
+    parser.add_argument("--unassigned-ratio", type=float, default=0.2)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    catalog = Catalog(args.catalog_size, args.areas, args.unassigned_ratio)
+    upstream = FakeUpstream(catalog, args.latency_ms, args.jitter_ms, args.error_rate, port=args.port)
+    print(f"Fake upstream listening on {upstream.base_url}")
+    upstream.server.serve_forever()
@@ -0,0 +1,272 @@
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import monitoring
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loadtest.fake_upstream import (
+    ALL_ITEMS_ENDPOINT, ITEM_CONFIG_ENDPOINT, UNASSIGNED_ITEMS_ENDPOINT, Catalog, FakeUpstream
+)
+
+# weighted mix of the polling dashboards
+API_SCENARIO = [
+    ("GET", "/api/auth/user", 5),
+    ("GET", "/api/items/overview", 3),
+    ("GET", "/api/items/overview/last-assigned", 2),
+    ("GET", "/api/items/history", 1),
+    ("GET", "/api/venues/", 1),
+    ("GET", "/api/users/", 1),
+]
+
+
+class MongoCounter(monitoring.CommandListener):
+    # counts every command the app sends, registered before the first client is created
+
+    def __init__(self):
+        self.counts = {}
+        self.lock = threading.Lock()
+        monitoring.register(self)
+
+    def started(self, event):
+        with self.lock:
+            self.counts[event.command_name] = self.counts.get(event.command_name, 0) + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def reset(self):
+        with self.lock:
+            self.counts = {}
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    total = len(latencies) + errors
+    return {
+        "requests": total,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput": round(total / elapsed, 2) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p90_ms": round(percentile(latencies, 0.90) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        "max_ms": round(max(latencies) * 1000, 2) if latencies else None,
+    }
+
+
+def seed(db, upstream, venues):
+    from werkzeug.security import generate_password_hash
+
+    venue_ids = [f"loadtest-{i}" for i in range(venues)]
+    for venue_id in venue_ids:
+        db.venue_settings.replace_one({"venue_id": venue_id}, {
+            "venue_id": venue_id,
+            "venue_name": f"Load test {venue_id}",
+            "venue_logo": "",
+            "endpoints": {
+                "BASE_URL": upstream.base_url,
+                "VENUE_ID": venue_id,
+                "MENU_ID": "menu",
+                "ITEM_CONFIG_ENDPOINT": ITEM_CONFIG_ENDPOINT,
+                "UNASSIGNED_ITEMS_ENDPOINT": UNASSIGNED_ITEMS_ENDPOINT,
+                "ALL_ITEMS_INFORMATION_ENDPOINT": f"{upstream.base_url}{ALL_ITEMS_ENDPOINT}",
+            },
+            "binMappings": [],
+            "locationTransformations": [],
+            "overflowLocations": [],
+            "schedule": {"scheduleType": "every_hour", "customTime": "00:00", "selectedDays": []},
+        }, upsert=True)
+        db.users.replace_one({"username": f"{venue_id}-manager"}, {
+            "username": f"{venue_id}-manager",
+            "email": "",
+            "password": generate_password_hash("loadtest"),
+            "role": "venue_manager",
+            "venue_id": venue_id,
+            "firstLogin": True,
+        }, upsert=True)
+
+    db.users.replace_one({"username": "loadtest-admin"}, {
+        "username": "loadtest-admin",
+        "email": "",
+        "password": generate_password_hash("loadtest"),
+        "role": "administrator",
+        "venue_id": venue_ids[0],
+        "firstLogin": True,
+    }, upsert=True)
+    # the refresh endpoint is not stubbed, hand out a token that never expires during the run
+    db.token.replace_one({}, {"access_token": "loadtest", "refresh_token": "loadtest", "expires_at": time.time() + 86400}, upsert=True)
+    return venue_ids
+
+
+def run_scheduler_scenario(venue_ids, concurrency):
+    # every venue fires at the same minute, as the hourly cron jobs do
+    from app.services.item_service import process_and_attach_items
+
+    durations = []
+    errors = 0
+    lock = threading.Lock()
+
+    def run(venue_id):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            process_and_attach_items(venue_id, force=True)
+            with lock:
+                durations.append(time.perf_counter() - started)
+        except Exception as e:
+            print(f"Scheduler run failed for {venue_id}: {e}")
+            with lock:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(run, venue_ids))
+    return summarize(durations, errors, time.perf_counter() - started)
+
+
+def run_api_scenario(base_url, tokens, duration, concurrency):
+    import requests
+
+    weighted = [(method, path) for method, path, weight in API_SCENARIO for _ in range(weight)]
+    latencies = {path: [] for _, path, _ in API_SCENARIO}
+    errors = {path: 0 for _, path, _ in API_SCENARIO}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        session = requests.Session()
+        rng = random.Random()
+        while time.perf_counter() < deadline:
+            method, path = rng.choice(weighted)
+            token = tokens["admin"] if path in ["/api/venues/", "/api/users/"] else rng.choice(tokens["venues"])
+            started = time.perf_counter()
+            try:
+                response = session.request(method, f"{base_url}{path}", headers={
+                    "Authorization": f"Bearer {token}",
+                    "Accept-Encoding": "gzip",
+                })
+                ok = response.status_code < 500
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                if ok:
+                    latencies[path].append(elapsed)
+                else:
+                    errors[path] += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "total": summarize(all_latencies, sum(errors.values()), elapsed),
+        "routes": {path: summarize(latencies[path], errors[path], elapsed) for path in latencies},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the app against a local fake upstream")
+    parser.add_argument("--scenario", choices=["api", "scheduler", "all"], default="all")
+    parser.add_argument("--mongo-uri", default=os.getenv("LOADTEST_MONGO_URI", "mongodb://localhost:27017/picking_routes_loadtest"))
+    parser.add_argument("--venues", type=int, default=10)
+    parser.add_argument("--catalog-size", type=int, default=5000)
+    parser.add_argument("--areas", type=int, default=20)
+    parser.add_argument("--unassigned-ratio", type=float, default=0.2)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--duration", type=float, default=30, help="seconds of api load")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--json", metavar="FILE", help="write the report as json")
+    args = parser.parse_args()
+
+    # configuration is read when the app package is imported
+    os.environ["MONGO_URI"] = args.mongo_uri
+    os.environ["RUN_SCHEDULER"] = "false"
+    os.environ.setdefault("ATTACH_ITEMS", "true")
+
+    mongo = MongoCounter()
+    catalog = Catalog(args.catalog_size, args.areas, args.unassigned_ratio)
+    upstream = FakeUpstream(catalog, args.latency_ms, args.jitter_ms, args.error_rate).start()
+
+    from app import create_app
+    from app.services.database import get_db
+    from app.services.picking_area_service import refresh_picking_areas
+    from app.services.upstream_service import get_upstream_metrics
+    from flask_jwt_extended import create_access_token
+    from werkzeug.serving import make_server
+
+    app = create_app()
+    venue_ids = seed(get_db(), upstream, args.venues)
+    # runs never wait on the picking areas endpoint, warm the cache before measuring
+    for venue_id in venue_ids:
+        refresh_picking_areas(venue_id, force=True)
+    report = {"config": vars(args), "scenarios": {}}
+
+    if args.scenario in ["scheduler", "all"]:
+        mongo.reset()
+        result = run_scheduler_scenario(venue_ids, args.concurrency)
+        report["scenarios"]["scheduler"] = {**result, "mongo": mongo.snapshot(), "upstream": upstream.stats()}
+
+    if args.scenario in ["api", "all"]:
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+
+        with app.app_context():
+            tokens = {
+                "admin": create_access_token("loadtest-admin", additional_claims={
+                    "venue_id": venue_ids[0], "venue_name": "", "venue_logo": "", "role": "administrator"
+                }),
+                "venues": [
+                    create_access_token(f"{venue_id}-manager", additional_claims={
+                        "venue_id": venue_id, "venue_name": "", "venue_logo": "", "role": "venue_manager"
+                    })
+                    for venue_id in venue_ids
+                ],
+            }
+
+        mongo.reset()
+        result = run_api_scenario(base_url, tokens, args.duration, args.concurrency)
+        report["scenarios"]["api"] = {**result, "mongo": mongo.snapshot()}
+        server.shutdown()
+
+    report["upstreamMetrics"] = get_upstream_metrics()
+    upstream.stop()
+
+    output = json.dumps(report, indent=2, default=str)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            file.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
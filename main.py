@@ -1,5 +1,12 @@
+import os
+
 from app import create_app
+from app.services.warmup_service import start_warmup
 
+# development server only, production runs `gunicorn -c gunicorn.conf.py` plus `python scheduler.py`
 if __name__ == '__main__':
     app = create_app()
+    # the reloader's parent only watches the files, the child that serves requests warms the caches
+    if os.environ.get("WERKZEUG_RUN_MAIN"):
+        start_warmup()
     app.run(use_reloader=True, port=9000, debug=True, threaded=True)
@@ -0,0 +1,7 @@
+from app.services.logging_service import setup_logging
+from app.services.schedule_service import run_scheduler
+
+# the only process that runs the venue jobs in production, the gunicorn workers start with RUN_SCHEDULER=false
+if __name__ == '__main__':
+    setup_logging()
+    run_scheduler()
@@ -0,0 +1,26 @@
+import argparse
+import signal
+import threading
+
+from app.services.logging_service import setup_logging
+from app.services.queue_service import new_worker_id, run_worker
+
+# pulls venue runs enqueued by the scheduler (SCHEDULER_EXECUTION=queue), start as many as needed on any node
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Venue run worker")
+    parser.add_argument("--concurrency", type=int, default=1, help="venues processed in parallel by this process")
+    args = parser.parse_args()
+
+    setup_logging()
+    # a running venue is finished before the thread exits, an interrupted one is resumed by another worker
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+    threads = [
+        threading.Thread(target=run_worker, args=(new_worker_id(), stop_event), name=f"worker-{i}")
+        for i in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
@@ -0,0 +1,4 @@
+from app import create_app
+
+# imported once by the gunicorn master (preload_app), workers inherit the loaded app
+app = create_app()